@@ -6,8 +6,10 @@ import logging
 import logging.handlers
 import traceback
 import threading
-import re
-import mimetypes
+import queue
+import atexit
+from collections import deque
+from concurrent.futures import CancelledError
 from datetime import timedelta, datetime, timezone
 from typing import Dict, Any
 import platform
@@ -19,18 +21,19 @@ import urllib.request
 import urllib.error
 import ssl
 import time
+import bisect
 
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QGridLayout,
-    QLabel, QLineEdit, QPushButton, QCheckBox, QTextEdit, QProgressBar,
+    QLabel, QLineEdit, QPushButton, QCheckBox, QTextEdit, QPlainTextEdit, QProgressBar,
     QGroupBox, QFileDialog, QMessageBox, QMenu, QDialog, QFontDialog, QDialogButtonBox,
-    QListWidget, QListWidgetItem, QFrame, QDateEdit, QSpinBox, QSizePolicy, QStyleFactory,
-    QComboBox
+    QFrame, QDateEdit, QSpinBox, QSizePolicy, QStyleFactory,
+    QComboBox, QTableWidget, QTableWidgetItem, QHeaderView, QAbstractItemView, QListView, QStyledItemDelegate, QStyle
 )
-from PyQt6.QtCore import Qt, QTimer, QThread, pyqtSignal, QUrl, QSize, QDate
+from PyQt6.QtCore import Qt, QTimer, QThread, pyqtSignal, QUrl, QSize, QDate, QRect, QRectF, QAbstractListModel, QModelIndex
 from PyQt6.QtGui import (
     QFont, QTextCursor, QCursor, QAction, QFontDatabase, QFontInfo, 
-    QPixmap, QImage, QIcon, QDesktopServices, QColor, QPainter, QPainterPath, QPalette, QActionGroup
+    QPixmap, QImage, QIcon, QDesktopServices, QColor, QPainter, QPainterPath, QPalette, QActionGroup, QPixmapCache
 )
 
 # --- Optional deps ---
@@ -52,16 +55,17 @@ try:
 except Exception:
     QRCODE_AVAILABLE = False
 
+from downloader_core import (
+    USER_DATA_DIR, CONFIG_FILE, DOWNLOAD_PATH_BASE, DownloadIndex, DownloadJob, job_from_spec,
+    get_client_service, shutdown_client_service, TransferStats, RateControl, TargetRegistry, format_transfer,
+    CHAT_CACHE_TTL, ChatRecord, load_chat_cache, remove_chat_cache, iter_dialog_pages, save_chat_cache,
+    profile_cache, cached_profile_photo, entity_photo_id, NAME_TEMPLATES, MEDIA_KINDS, format_bytes, free_disk_space
+)
+
 # --- Constants ---
 APP_NAME = "Telegram Media Downloader"
 APP_VERSION = "3.5.0"
 APP_USER_MODEL_ID = "com.ozodesigner.telegram_media_downloader"
-USER_DATA_DIR = os.path.join(
-    os.environ.get('LOCALAPPDATA') or os.environ.get('APPDATA') or os.path.expanduser('~'),
-    'TelegramMediaDownloader'
-)
-CONFIG_FILE = os.path.join(USER_DATA_DIR, "tg_downloader_config.json")
-DOWNLOAD_PATH_BASE = 'telegram_gui_downloads'
 DEFAULT_FONT_SIZE = 10
 LOG_FONT_SIZE = 9
 COPYRIGHT_FONT_SIZE = 8
@@ -69,6 +73,9 @@ DONATION_FONT_SIZE = 13
 COPYRIGHT_TEXT = "© Ozo.Designer 2025"
 DONATION_URL = "https://link.payway.com.kh/ABAPAYm0348597m"
 LOG_QUEUE_INTERVAL_MS = 250
+LOG_BUFFER_MAX_LINES = 20000  # Lines waiting for the next drain; older ones are dropped from the view (not the file log)
+LOG_VIEW_MAX_LINES = 5000
+PROGRESS_UPDATE_INTERVAL_MS = 200  # Transfer stats reach the UI at most this often
 UPDATE_CHECK_URL = "https://api.github.com/repos/Heng-zm/Telegram-Media-Downloader/releases/latest"
 
 # Telemetry
@@ -88,10 +95,17 @@ DEFAULT_CONFIG: Dict[str, Any] = {
     "telemetry_enabled": True,
     "use_date_filter": False, "date_start": "", "date_end": "",
     "use_limit_filter": False, "limit_count": 100,
+    "sync_mode": False,
+    "job_queue": [], "batch_parallel_chats": 2,
     "ui_font_family": "", 
     "ui_font_size": DEFAULT_FONT_SIZE,
     "ui_theme": "Dark",
-    "group_mode": "flat"
+    "group_mode": "flat",
+    "filename_template": "{orig_name}",
+    "max_concurrent_downloads": 3,
+    "bandwidth_limit_kbps": 0,
+    "large_file_threshold_mb": 100, "large_file_parts": 4,
+    "dedup_enabled": True, "dedup_hash": False, "dedup_symlinks": False
 }
 
 # --- Stylesheets ---
@@ -114,10 +128,10 @@ QPushButton {
 QPushButton:hover { background-color: #454545; border-color: #0088cc; }
 QPushButton:pressed { background-color: #252525; }
 QPushButton:disabled { background-color: #2b2b2b; color: #777; border-color: #444; }
-QListWidget { background-color: #333; border: 1px solid #555; border-radius: 5px; }
+QListView { background-color: #333; border: 1px solid #555; border-radius: 5px; }
 QProgressBar { border: 1px solid #555; border-radius: 5px; text-align: center; background-color: #333; color: white; }
 QProgressBar::chunk { background-color: #0088cc; width: 10px; }
-QTextEdit { background-color: #1e1e1e; color: #00ff00; border: 1px solid #444; }
+QTextEdit, QPlainTextEdit { background-color: #1e1e1e; color: #00ff00; border: 1px solid #444; }
 QCheckBox { spacing: 5px; }
 QCheckBox::indicator { width: 16px; height: 16px; }
 QMenu { background-color: #2b2b2b; border: 1px solid #555; color: white; }
@@ -147,10 +161,10 @@ QPushButton {
 QPushButton:hover { background-color: #e6f7ff; border-color: #0088cc; }
 QPushButton:pressed { background-color: #d0d0d0; }
 QPushButton:disabled { background-color: #f0f0f0; color: #aaa; border-color: #ddd; }
-QListWidget { background-color: #ffffff; border: 1px solid #ccc; border-radius: 5px; }
+QListView { background-color: #ffffff; border: 1px solid #ccc; border-radius: 5px; }
 QProgressBar { border: 1px solid #ccc; border-radius: 5px; text-align: center; background-color: #e0e0e0; color: black; }
 QProgressBar::chunk { background-color: #0088cc; width: 10px; }
-QTextEdit { background-color: #ffffff; color: #333; border: 1px solid #ccc; }
+QTextEdit, QPlainTextEdit { background-color: #ffffff; color: #333; border: 1px solid #ccc; }
 QCheckBox { spacing: 5px; }
 QCheckBox::indicator { width: 16px; height: 16px; }
 QMenu { background-color: #ffffff; border: 1px solid #ccc; color: black; }
@@ -180,6 +194,17 @@ translations = {
         "filter_photos": "Photos", "filter_videos": "Videos", "filter_audio": "Audio", "filter_docs": "Docs",
         "filter_voice": "Voice", "filter_stickers": "Stickers", "filter_gifs": "GIFs", "filter_video_notes": "Video Notes",
         "filter_date_cb": "Filter by Date", "filter_limit_cb": "Limit Count",
+        "sync_mode_cb": "Only new messages since last run",
+        "job_queue_button": "Job Queue...", "job_queue_title": "Job Queue",
+        "job_add_btn": "Add Selected Chat", "job_remove_btn": "Remove", "job_run_btn": "Run Queue",
+        "job_parallel_label": "Chats at once:",
+        "job_col_chat": "Chat", "job_col_media": "Media", "job_col_dates": "Date range", "job_col_group": "Grouping", "job_col_status": "Status",
+        "job_queue_empty_title": "Empty Queue", "job_queue_empty_msg": "Add at least one chat to the job queue.",
+        "retry_failed_button": "Retry Failed", "no_failures_title": "Nothing to Retry", "no_failures_msg": "No failed downloads are recorded for this chat.",
+        "estimate_button": "Estimate", "estimate_title": "Download Estimate", "progress_label_estimating": "Estimating (nothing is downloaded)...",
+        "estimate_summary": "{files} files, {size} to download", "estimate_present": "Already downloaded: {count}",
+        "estimate_linked": "Duplicates linked instead of downloaded: {count} ({size})", "estimate_free": "Free space in {path}: {size}",
+        "estimate_short": "Not enough free space: {size} more needed.", "estimate_ready": "Estimate ready.",
         "start_button": "Start Download", "stop_button": "Stop Download", "logs_frame": "Logs",
         "support_donate": "Pay Coffee",
         "progress_label_starting": "Starting download...", "progress_label_stopping": "Stopping download...",
@@ -198,10 +223,17 @@ translations = {
         "group_chat": "Folder by Chat",
         "group_chat_type": "Folder by Chat > Type",
         "group_chat_date": "Folder by Chat > Date",
+        "name_template_label": "File Naming:",
+        "name_orig": "Original name",
+        "name_msg_orig": "Message ID + name",
+        "name_date_id": "Date + media ID",
+        "concurrency_label": "Parallel downloads:",
+        "bandwidth_label": "Speed limit:",
+        "bandwidth_unlimited": "Unlimited",
         "qr_dep_missing": "Install required packages: pip install qrcode[pil]",
         "qr_title": "Scan QR in Telegram",
         "qr_instructions": "Open Telegram > Settings > Devices > Link Desktop Device, then scan.",
-        "chat_select_title": "Select Chat", "chat_choose_lbl": "Choose a conversation", "chat_search_ph": "Search users, groups, channels...",
+        "chat_select_title": "Select Chat", "chat_choose_lbl": "Choose a conversation", "chat_refresh_btn": "Refresh", "chat_search_ph": "Search users, groups, channels...",
         "cat_users": "USERS & BOTS", "cat_groups": "GROUPS & CHANNELS",
         "btn_cancel": "Cancel", "btn_select": "Select",
         "howto_api_title": "How to get API ID & API Hash",
@@ -230,6 +262,17 @@ translations = {
         "filter_photos": "រូបថត", "filter_videos": "វីដេអូ", "filter_audio": "សំឡេង", "filter_docs": "ឯកសារ",
         "filter_voice": "សារសំឡេង", "filter_stickers": "ស្ទីកគ័រ", "filter_gifs": "GIFs", "filter_video_notes": "Video Notes",
         "filter_date_cb": "តាមកាលបរិច្ឆេទ", "filter_limit_cb": "កំណត់ចំនួន",
+        "sync_mode_cb": "តែសារថ្មីចាប់ពីលើកមុន",
+        "job_queue_button": "ជួរការងារ...", "job_queue_title": "ជួរការងារ",
+        "job_add_btn": "បន្ថែម Chat ដែលបានជ្រើស", "job_remove_btn": "លុបចេញ", "job_run_btn": "ដំណើរការជួរ",
+        "job_parallel_label": "ចំនួន Chat ក្នុងពេលតែមួយ:",
+        "job_col_chat": "Chat", "job_col_media": "មេឌៀ", "job_col_dates": "កាលបរិច្ឆេទ", "job_col_group": "ការដាក់ឯកសារ", "job_col_status": "ស្ថានភាព",
+        "job_queue_empty_title": "ជួរទទេ", "job_queue_empty_msg": "សូមបន្ថែម Chat យ៉ាងហោចណាស់មួយទៅក្នុងជួរ។",
+        "retry_failed_button": "ទាញយកដែលបរាជ័យម្តងទៀត", "no_failures_title": "គ្មានអ្វីត្រូវធ្វើម្តងទៀត", "no_failures_msg": "មិនមានការទាញយកបរាជ័យសម្រាប់ Chat នេះទេ។",
+        "estimate_button": "ប៉ាន់ស្មាន", "estimate_title": "ការប៉ាន់ស្មានទំហំទាញយក", "progress_label_estimating": "កំពុងប៉ាន់ស្មាន (មិនទាញយកអ្វីទេ)...",
+        "estimate_summary": "{files} ឯកសារ, {size} ត្រូវទាញយក", "estimate_present": "បានទាញយករួចហើយ: {count}",
+        "estimate_linked": "ឯកសារស្ទួនដែលភ្ជាប់ជំនួសការទាញយក: {count} ({size})", "estimate_free": "ទំហំទំនេរនៅ {path}: {size}",
+        "estimate_short": "ទំហំទំនេរមិនគ្រប់គ្រាន់: ត្រូវការបន្ថែម {size}។", "estimate_ready": "ការប៉ាន់ស្មានរួចរាល់។",
         "start_button": "ចាប់ផ្តើមទាញយក", "stop_button": "បញ្ឈប់ការទាញយក", "logs_frame": "កំណត់ហេតុ",
         "support_donate": "ឧបត្ថម្ភ កាហ្វេ",
         "progress_label_starting": "កំពុងចាប់ផ្តើមទាញយក...", "progress_label_stopping": "កំពុងបញ្ឈប់ការទាញយក...",
@@ -248,10 +291,17 @@ translations = {
         "group_chat": "តាម Chat",
         "group_chat_type": "តាម Chat > ប្រភេទ",
         "group_chat_date": "តាម Chat > កាលបរិច្ឆេទ",
+        "name_template_label": "ការដាក់ឈ្មោះឯកសារ:",
+        "name_orig": "ឈ្មោះដើម",
+        "name_msg_orig": "លេខសារ + ឈ្មោះ",
+        "name_date_id": "កាលបរិច្ឆេទ + លេខមេឌៀ",
+        "concurrency_label": "ទាញយកស្របគ្នា:",
+        "bandwidth_label": "កំណត់ល្បឿន:",
+        "bandwidth_unlimited": "គ្មានកំណត់",
         "qr_dep_missing": "សូមដំឡើង: pip install qrcode[pil]",
         "qr_title": "ស្កេន QR ក្នុង Telegram",
         "qr_instructions": "បើក Telegram > Settings > Devices > Link Desktop Device, ហើយស្កេន។",
-        "chat_select_title": "ជ្រើសរើសការសន្ទនា", "chat_choose_lbl": "ជ្រើសរើសការសន្ទនា", "chat_search_ph": "ស្វែងរក អ្នកប្រើប្រាស់, ក្រុម, ឆានែល...",
+        "chat_select_title": "ជ្រើសរើសការសន្ទនា", "chat_choose_lbl": "ជ្រើសរើសការសន្ទនា", "chat_refresh_btn": "ផ្ទុកឡើងវិញ", "chat_search_ph": "ស្វែងរក អ្នកប្រើប្រាស់, ក្រុម, ឆានែល...",
         "cat_users": "អ្នកប្រើប្រាស់ & BOTS", "cat_groups": "ក្រុម & ឆានែល",
         "btn_cancel": "បោះបង់", "btn_select": "ជ្រើសរើស",
         "howto_api_title": "របៀបយក API ID និង API Hash",
@@ -272,24 +322,38 @@ logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 ch = logging.StreamHandler(sys.stdout)
 ch.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s', datefmt='%H:%M:%S'))
-logger.addHandler(ch)
+_log_handlers = [ch]
 try:
     os.makedirs(USER_DATA_DIR, exist_ok=True)
     _log_path = os.path.join(USER_DATA_DIR, 'app.log')
     fh = logging.handlers.RotatingFileHandler(_log_path, maxBytes=1_000_000, backupCount=3, encoding='utf-8')
     fh.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(name)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S'))
-    logger.addHandler(fh)
+    _log_handlers.append(fh)
 except Exception: pass
-
-# --- Helper: Sanitize Filename ---
-def sanitize_filename(name: str) -> str:
-    """Removes illegal characters from filenames for Windows/Linux."""
-    if not name: return "unnamed_file"
-    # Remove characters invalid on Windows
-    name = re.sub(r'[<>:"/\\|?*]', '_', name)
-    # Remove control characters
-    name = "".join(ch for ch in name if ord(ch) >= 32)
-    return name.strip() or "unnamed_file"
+# Console and file writes happen on a listener thread; callers only enqueue the record
+_log_records = queue.SimpleQueue()
+logger.addHandler(logging.handlers.QueueHandler(_log_records))
+_log_listener = logging.handlers.QueueListener(_log_records, *_log_handlers, respect_handler_level=True)
+_log_listener.start(); atexit.register(_log_listener.stop)
+activity_logger = logger.getChild('activity')  # Lines shown in the log panel
+
+class LogBuffer:
+    """Thread-safe ring buffer between log producers (any thread) and the UI timer that drains it."""
+    def __init__(self, maxlen: int = LOG_BUFFER_MAX_LINES) -> None:
+        self._lines = deque(maxlen=maxlen); self._lock = threading.Lock(); self.dropped = 0
+
+    def push(self, message: str) -> None:
+        activity_logger.info(message)
+        with self._lock:
+            if len(self._lines) == self._lines.maxlen: self.dropped += 1
+            self._lines.append(message)
+
+    def drain(self) -> tuple[list, int]:
+        """Returns (lines, dropped since the last drain)."""
+        with self._lock:
+            lines = list(self._lines); self._lines.clear()
+            dropped, self.dropped = self.dropped, 0
+        return lines, dropped
 
 # --- Telegram error reporting ---
 def _post_telegram_message(token: str, chat_id: str, text: str) -> None:
@@ -347,217 +411,127 @@ class GetOwnProfileWorker(QThread):
     def __init__(self, api_id, api_hash, session_string, parent=None):
         super().__init__(parent); self.api_id = api_id; self.api_hash = api_hash; self.session_string = session_string
     def run(self):
-        import asyncio
-        from telethon import TelegramClient
-        from telethon.sessions import StringSession
-        async def _get_me():
-            client = TelegramClient(StringSession(self.session_string), self.api_id, self.api_hash)
+        async def _get_me(client):
             try:
-                await client.connect()
                 if not await client.is_user_authorized():
                     self.auth_failed.emit()
                     return
                 me = await client.get_me()
                 name = f"@{me.username}" if getattr(me, 'username', None) else (me.first_name or "User")
-                photo_path = os.path.join(USER_DATA_DIR, sanitize_filename(f"my_avatar_{me.id}.jpg"))
-                saved_path = await client.download_profile_photo(me, file=photo_path)
+                saved_path = await cached_profile_photo(client, me, me.id)
+                profile_cache().put(me.id, entity_photo_id(me), {"id": me.id, "title": name})
                 self.info_loaded.emit(name, saved_path if saved_path else "")
             except (SessionRevokedError, AuthKeyUnregisteredError): 
                 self.auth_failed.emit()
             except Exception: pass
-            finally: 
-                if client: await client.disconnect()
-        try:
-            loop = asyncio.new_event_loop(); asyncio.set_event_loop(loop); loop.run_until_complete(_get_me()); loop.close()
+        try: get_client_service(self.api_id, self.api_hash, self.session_string).call(_get_me)
+        except (SessionRevokedError, AuthKeyUnregisteredError): self.auth_failed.emit()
         except Exception: pass
 
 class FetchChatsWorker(QThread):
-    chats_fetched = pyqtSignal(list); error = pyqtSignal(str); finished_signal = pyqtSignal()
+    """Enumerates every dialog page by page; each page is emitted as it arrives, then the full list is cached."""
+    chats_page = pyqtSignal(list); chats_fetched = pyqtSignal(list); error = pyqtSignal(str); finished_signal = pyqtSignal()
     def __init__(self, api_id, api_hash, session, parent=None): super().__init__(parent); self.id=api_id; self.hash=api_hash; self.sess=session
     def run(self):
-        import asyncio; from telethon import TelegramClient; from telethon.sessions import StringSession
-        async def _run():
-            client = TelegramClient(StringSession(self.sess), self.id, self.hash)
-            try:
-                await client.connect(); res = []
-                async for d in client.iter_dialogs(limit=200):
-                    name = d.name
-                    if d.is_group or d.is_channel:
-                         try: 
-                             c = d.entity.participants_count
-                             if c: name += f" ({c})"
-                         except: pass
-                    res.append((name, d.id))
-                self.chats_fetched.emit(res)
-            except Exception as e: self.error.emit(str(e))
-            finally: await client.disconnect()
-        loop = asyncio.new_event_loop(); asyncio.set_event_loop(loop)
-        try: loop.run_until_complete(_run())
-        finally: loop.close(); self.finished_signal.emit()
+        async def _run(client):
+            res = []
+            async for page in iter_dialog_pages(client):
+                res.extend(page); self.chats_page.emit(page)
+            return res
+        try:
+            res = get_client_service(self.id, self.hash, self.sess).call(_run)
+            try: save_chat_cache(self.id, res)
+            except OSError: pass
+            self.chats_fetched.emit(res)
+        except Exception as e: self.error.emit(str(e))
+        finally: self.finished_signal.emit()
 
 class FetchProfileWorker(QThread):
+    """Emits the chat's profile, straight from the profile cache (no requests) while it is fresh and the dialog list reports the same photo."""
     profile_fetched = pyqtSignal(dict); error = pyqtSignal(str); finished_signal = pyqtSignal()
-    def __init__(self, api_id, api_hash, session, chat_id, parent=None): super().__init__(parent); self.id=api_id; self.hash=api_hash; self.sess=session; self.chat_id=chat_id
+    def __init__(self, api_id, api_hash, session, chat_id, photo_id=None, parent=None):
+        super().__init__(parent); self.id=api_id; self.hash=api_hash; self.sess=session; self.chat_id=chat_id; self.photo_id=photo_id
     def run(self):
-        import asyncio; from telethon import TelegramClient; from telethon.sessions import StringSession; from telethon.tl.functions.users import GetFullUserRequest; from telethon.tl.functions.channels import GetFullChannelRequest
-        async def _run():
-            client = TelegramClient(StringSession(self.sess), self.id, self.hash)
+        from telethon.tl.functions.users import GetFullUserRequest; from telethon.tl.functions.channels import GetFullChannelRequest
+        cached = profile_cache().get(self.chat_id, self.photo_id)
+        if cached is not None:
+            self.profile_fetched.emit(cached); self.finished_signal.emit(); return
+        async def _run(client):
+            ent = await client.get_entity(self.chat_id); desc = ""
             try:
-                await client.connect(); ent = await client.get_entity(self.chat_id); desc = ""
-                try:
-                    if isinstance(ent, User): desc = (await client(GetFullUserRequest(ent))).about
-                    else: desc = (await client(GetFullChannelRequest(ent))).full_chat.about
-                except: pass
-                p_path = None
-                try: 
-                    p_path = await client.download_profile_photo(ent, file=os.path.join(USER_DATA_DIR, sanitize_filename(f"tmp_{self.chat_id}.jpg")))
-                except: pass
-                data = { "id": ent.id, "title": getattr(ent, 'title', getattr(ent, 'first_name', 'N/A')), "username": getattr(ent, 'username', None), "description": desc, "members_count": getattr(ent, 'participants_count', getattr(ent, 'subscribers', None)), "photo_path": p_path }
-                self.profile_fetched.emit(data)
-            except Exception as e: self.error.emit(str(e))
-            finally: await client.disconnect()
-        loop = asyncio.new_event_loop(); asyncio.set_event_loop(loop)
-        try: loop.run_until_complete(_run())
-        finally: loop.close(); self.finished_signal.emit()
+                if isinstance(ent, User): desc = (await client(GetFullUserRequest(ent))).about
+                else: desc = (await client(GetFullChannelRequest(ent))).full_chat.about
+            except: pass
+            p_path = None
+            try: p_path = await cached_profile_photo(client, ent, self.chat_id)
+            except: pass
+            data = { "id": ent.id, "title": getattr(ent, 'title', getattr(ent, 'first_name', 'N/A')), "username": getattr(ent, 'username', None), "description": desc, "members_count": getattr(ent, 'participants_count', getattr(ent, 'subscribers', None)), "photo_path": p_path }
+            profile_cache().put(self.chat_id, entity_photo_id(ent), data)
+            self.profile_fetched.emit(data)
+        try: get_client_service(self.id, self.hash, self.sess).call(_run)
+        except Exception as e: self.error.emit(str(e))
+        finally: self.finished_signal.emit()
 
 class DownloadWorker(QThread):
-    progress = pyqtSignal(int); status = pyqtSignal(str); log = pyqtSignal(str); finished_signal = pyqtSignal(bool, str)
-    def __init__(self, api_id, api_hash, session, target, folder, filters, skip, date_filter=None, limit=None, group_mode='flat', chat_title=None, parent=None):
+    transfer = pyqtSignal(dict); status = pyqtSignal(str); log = pyqtSignal(str); planned = pyqtSignal(dict); finished_signal = pyqtSignal(bool, str)
+    def __init__(self, api_id, api_hash, session, target, folder, filters, skip, date_filter=None, limit=None, group_mode='flat', chat_title=None, concurrency=1,
+                 sync_only=False, bandwidth_limit=0, parent=None, **engine_options):
+        """`engine_options` are passed through to DownloadJob (see MainWindow._engine_options); `bandwidth_limit` is bytes/s, 0 for none."""
         super().__init__(parent); self.api_id = api_id; self.api_hash = api_hash; self.session = session
-        self.target = target; self.folder = folder; self.filters = filters; self.skip = skip; self.date_filter = date_filter; self.limit = limit
-        self.group_mode = group_mode; self.chat_title = chat_title or str(target)
-        self._stop = False; self._loop = None
-    def stop(self): self._stop = True
+        self.rate = RateControl(bandwidth_limit, concurrency)
+        self.job = DownloadJob(target, folder, filters, skip, date_filter, limit, group_mode, chat_title, concurrency, sync_only=sync_only,
+                               log=self.log.emit, status=self.status.emit, stats=TransferStats(self.transfer.emit, PROGRESS_UPDATE_INTERVAL_MS / 1000),
+                               rate=self.rate, **engine_options)
+    def stop(self): self.job.stop()
+    def set_bandwidth(self, bytes_per_sec): self.rate.set_bandwidth(bytes_per_sec)
     def run(self):
-        import asyncio, time
-        from telethon import TelegramClient
-        from telethon.sessions import StringSession
-        from telethon.tl.types import DocumentAttributeFilename, DocumentAttributeVideo
-        async def _run():
-            client = TelegramClient(StringSession(self.session), self.api_id, self.api_hash)
-            try:
-                await client.connect()
-                try: entity = await client.get_entity(int(self.target) if str(self.target).lstrip('-').isdigit() else self.target)
-                except Exception: entity = await client.get_entity(self.target)
-                count = 0; processed = 0
-                
-                # Base folder preparation
-                base_folder = self.folder
-                if self.group_mode in ['chat', 'chat_type', 'chat_date']:
-                    base_folder = os.path.join(self.folder, sanitize_filename(self.chat_title))
-                
-                # Ensure base folder exists if we are flat, or it will be created inside loop
-                if self.group_mode == 'flat':
-                     os.makedirs(base_folder, exist_ok=True)
-
-                async for msg in client.iter_messages(entity):
-                    if self._stop: break
-                    if self.limit and processed >= self.limit: self.log.emit(f"[INFO] Reached limit of {self.limit} messages."); break
-                    if self.date_filter:
-                        start_dt, end_dt = self.date_filter
-                        if msg.date:
-                            m_dt = msg.date.astimezone(timezone.utc)
-                            if m_dt > end_dt: continue 
-                            if m_dt < start_dt: self.log.emit("[INFO] Reached start date boundary."); break
-                    if not msg.media: continue
-                    matched = False
-                    
-                    # Determine type for matching and grouping
-                    media_type = "Other"
-                    is_video = False; is_audio = False
-                    
-                    if self.filters['photo'] and getattr(msg, 'photo', None): 
-                        matched = True; media_type = "Photos"
-                    elif msg.document:
-                        mime = getattr(msg.document, 'mime_type', '') or ''; attrs = msg.document.attributes or []
-                        is_video = mime.startswith('video/') or any(isinstance(a, DocumentAttributeVideo) for a in attrs)
-                        is_audio = mime.startswith('audio/') or getattr(msg, 'voice', False)
-                        is_sticker = mime == 'application/x-tgsticker' or 'sticker' in mime
-                        is_gif = mime == 'image/gif'
-                        
-                        if self.filters['video'] and is_video: matched = True; media_type = "Videos"
-                        elif self.filters['audio'] and is_audio: matched = True; media_type = "Audio"
-                        elif self.filters['sticker'] and is_sticker: matched = True; media_type = "Stickers"
-                        elif self.filters['gif'] and is_gif: matched = True; media_type = "GIFs"
-                        elif self.filters['document']: matched = True; media_type = "Documents"
-                    
-                    if not matched: continue
-                    processed += 1
-                    
-                    # --- FIX: Determine correct filename with extension BEFORE checking existence ---
-                    fname = None
-                    if msg.document:
-                        for a in msg.document.attributes or []: 
-                            if isinstance(a, DocumentAttributeFilename): fname = a.file_name; break
-                    
-                    if not fname:
-                        # Generate a name based on ID, but we MUST guess extension for it to match disk
-                        base_name = f"file_{msg.id}"
-                        ext = ""
-                        if getattr(msg, 'photo', None):
-                            ext = ".jpg"
-                        elif getattr(msg, 'document', None):
-                            # Try to guess from mime_type
-                            mime_type = getattr(msg.document, 'mime_type', '')
-                            if mime_type:
-                                ext = mimetypes.guess_extension(mime_type) or ""
-                        
-                        fname = f"{base_name}{ext}"
-                    
-                    fname = sanitize_filename(fname)
-                    # -------------------------------------------------------------------------------
-
-                    # Smart Organization Logic
-                    final_folder = base_folder
-                    if self.group_mode == 'chat_type':
-                        final_folder = os.path.join(base_folder, media_type)
-                    elif self.group_mode == 'chat_date':
-                        if msg.date:
-                            date_str = f"{msg.date.year}-{msg.date.month:02d}"
-                            final_folder = os.path.join(base_folder, date_str)
-                        else:
-                            final_folder = os.path.join(base_folder, "Unknown_Date")
-                    
-                    os.makedirs(final_folder, exist_ok=True)
-                    path = os.path.join(final_folder, fname)
-                    
-                    if os.path.exists(path):
-                        if self.skip:
-                            # 1. Check for Document Size Match
-                            if getattr(msg, 'document', None):
-                                # If sizes match, it's the same file
-                                if os.path.getsize(path) == msg.document.size:
-                                    self.log.emit(f"[SKIP] {fname} exists (Size match).")
-                                    continue
-                            # 2. Check for Photo (ID-based filename existence is sufficient)
-                            elif getattr(msg, 'photo', None):
-                                 self.log.emit(f"[SKIP] {fname} exists.")
-                                 continue
-                        
-                        # If we are here, either skip is False, or size didn't match (for docs)
-                        # Rename to avoid overwriting
-                        base, ext = os.path.splitext(path)
-                        path = f"{base}_{int(time.time())}{ext}"
-                    
-                    self.status.emit(f"Downloading: {fname}")
+        try:
+            completed = get_client_service(self.api_id, self.api_hash, self.session).call(self.job.run)
+            if self.job.dry_run and completed: self.planned.emit(self.job.summary)
+            if completed: self.finished_signal.emit(True, "Done")
+            else: self.finished_signal.emit(False, "Stopped")
+        except CancelledError: self.finished_signal.emit(False, "Stopped")  # Client service shut down (logout) mid-run
+        except Exception as e: self.finished_signal.emit(False, str(e))
+
+class BatchDownloadWorker(QThread):
+    """Runs several queued chat jobs over the shared client, at most `max_parallel` at a time."""
+    transfer = pyqtSignal(dict); status = pyqtSignal(str); log = pyqtSignal(str); job_state = pyqtSignal(int, str); finished_signal = pyqtSignal(bool, str)
+    def __init__(self, api_id, api_hash, session, specs: list, max_parallel=2, concurrency=1, bandwidth_limit=0, parent=None, **engine_options):
+        super().__init__(parent); self.api_id = api_id; self.api_hash = api_hash; self.session = session
+        self.max_parallel = max(1, int(max_parallel or 1)); self._stop = False
+        stats = TransferStats(self.transfer.emit, PROGRESS_UPDATE_INTERVAL_MS / 1000)  # One aggregate across all chats
+        self.rate = RateControl(bandwidth_limit, self.max_parallel * max(1, int(concurrency or 1)))  # One cap and FloodWait state for the account
+        targets = TargetRegistry()  # Chats sharing a folder must see each other's claimed names
+        self.jobs = [job_from_spec(spec, concurrency=concurrency, **engine_options,
+                                   log=lambda m, t=spec.get('title') or spec['chat_id']: self.log.emit(f"[{t}] {m}"), status=self.status.emit, stats=stats,
+                                   rate=self.rate, targets=targets)
+                     for spec in specs]
+    def stop(self):
+        self._stop = True
+        for job in self.jobs: job.stop()
+    def set_bandwidth(self, bytes_per_sec): self.rate.set_bandwidth(bytes_per_sec)
+    def run(self):
+        import asyncio
+        async def _run(client):
+            if not await client.is_user_authorized(): raise RuntimeError("Session is not authorized")
+            sem = asyncio.Semaphore(self.max_parallel); index = DownloadIndex()
+            async def _one(i, job):
+                async with sem:
+                    if self._stop: return
+                    self.job_state.emit(i, 'running')
                     try:
-                        await client.download_media(msg, path, progress_callback=lambda c, t: self.progress.emit(int(c*100/t)) if t else None)
-                        self.log.emit(f"[OK] Saved: {os.path.basename(path)}"); count += 1
-                    except Exception as e: self.log.emit(f"[ERROR] {fname}: {e}")
-                
-                if self._stop: self.finished_signal.emit(False, "Stopped")
-                else: self.finished_signal.emit(True, "Done")
-            except Exception as e: self.finished_signal.emit(False, str(e))
-            finally: 
-                if client: await client.disconnect()
-        try: 
-            self._loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(self._loop)
-            self._loop.run_until_complete(_run())
-        except Exception as e:
-            logger.error(f"Loop error: {e}")
-        finally: 
-            if self._loop: self._loop.close()
+                        completed = await job.run(client, index)
+                        self.job_state.emit(i, 'stopped' if not completed else ('failed' if job.failed else 'done'))
+                    except Exception as e:
+                        self.log.emit(f"[ERROR] [{job.chat_title}] {e}"); self.job_state.emit(i, 'failed')
+            try: await asyncio.gather(*(_one(i, job) for i, job in enumerate(self.jobs)))
+            finally: index.close()
+        try:
+            get_client_service(self.api_id, self.api_hash, self.session).call(_run)
+            if self._stop: self.finished_signal.emit(False, "Stopped")
+            else: self.finished_signal.emit(True, "Done")
+        except CancelledError: self.finished_signal.emit(False, "Stopped")
+        except Exception as e: self.finished_signal.emit(False, str(e))
 
 class QrLoginWorker(QThread):
     show_url = pyqtSignal(str); error = pyqtSignal(str); success = pyqtSignal(str, int, str, str)
@@ -630,27 +604,153 @@ class UpdateDownloadWorker(QThread):
             ctx = ssl.create_default_context(); ctx.check_hostname = False; ctx.verify_mode = ssl.CERT_NONE
             with urllib.request.urlopen(req, context=ctx, timeout=30) as r, open(self.path, 'wb') as f:
                 total = int(r.getheader('Content-Length', 0)); dl = 0
+                last_pct = None
+                if total <= 0: self.progress.emit(-1)
                 while chunk := r.read(32768): 
-                    f.write(chunk); dl += len(chunk); 
-                    if total > 0: self.progress.emit(int(dl*100/total))
-                    else: self.progress.emit(-1)
+                    f.write(chunk); dl += len(chunk)
+                    # Only cross threads when the visible percentage actually moves
+                    if total > 0 and (pct := int(dl*100/total)) != last_pct: last_pct = pct; self.progress.emit(pct)
             self.finished_signal.emit(True, self.path)
         except Exception as e: self.finished_signal.emit(False, str(e))
 
 # --- DIALOG CLASSES ---
 
-class ChatListItemWidget(QWidget):
-    def __init__(self, name: str, detail: str, initial: str, color: str, parent=None):
+CHAT_AVATAR_COLORS = ["#e53935", "#43a047", "#1e88e5", "#8e24aa", "#00acc1", "#ffb300", "#fb8c00", "#6d4c41", "#00AA55", "#55AA00"]
+CHAT_SEARCH_DEBOUNCE_MS = 150
+
+class ChatListModel(QAbstractListModel):
+    """Flat rows of category headers and chats. Filtering swaps the visible row list; the view only asks
+    the delegate to paint rows that are on screen."""
+    ChatIdRole = Qt.ItemDataRole.UserRole; TitleRole = Qt.ItemDataRole.UserRole + 1
+    HeaderRole = Qt.ItemDataRole.UserRole + 2; DetailRole = Qt.ItemDataRole.UserRole + 3; ColorRole = Qt.ItemDataRole.UserRole + 4
+    AvatarRole = Qt.ItemDataRole.UserRole + 5
+
+    def __init__(self, categories: list, parent=None) -> None:
+        """`categories` is [(header title, [ChatRecord, ...]), ...] in display order."""
         super().__init__(parent)
-        layout = QHBoxLayout(self); layout.setContentsMargins(10, 5, 10, 5); layout.setSpacing(15)
-        self.avatar = QLabel(initial); self.avatar.setFixedSize(45, 45); self.avatar.setAlignment(Qt.AlignmentFlag.AlignCenter)
-        self.avatar.setStyleSheet(f"background-color: {color}; color: white; font-weight: bold; font-size: 18px; border-radius: 22px;")
-        text_layout = QVBoxLayout(); text_layout.setSpacing(2); text_layout.setContentsMargins(0, 0, 0, 0)
-        self.name_lbl = QLabel(name); self.name_lbl.setStyleSheet("font-size: 14px; font-weight: 600;")
-        self.detail_lbl = QLabel(detail); self.detail_lbl.setStyleSheet("font-size: 12px; opacity: 0.8;")
-        text_layout.addWidget(self.name_lbl); text_layout.addWidget(self.detail_lbl); text_layout.addStretch()
-        layout.addWidget(self.avatar); layout.addLayout(text_layout); layout.addStretch()
-        self.setAttribute(Qt.WidgetAttribute.WA_TransparentForMouseEvents, True) 
+        self._rows = []; self._sections = []  # rows: (header?, name, search key, record, color, detail, avatar path); sections: (header row, [chat rows])
+        # Avatar paths are resolved here from one listing of the cache folder, not with a file check on every paint
+        cache = profile_cache(); avatars = cache.avatar_files()
+        for header, chats in categories:
+            if not chats: continue
+            head = len(self._rows); self._rows.append((True, header, "", None, None, None, None)); members = []
+            for rec in chats:
+                members.append(len(self._rows))
+                key = f"{rec.title}\t@{rec.username}" if rec.username else rec.title
+                avatar = cache.photo_file(rec.id, rec.photo_id) if rec.photo_id else None
+                if avatar and os.path.basename(avatar) not in avatars: avatar = None
+                self._rows.append((False, rec.title, key.lower(), rec, CHAT_AVATAR_COLORS[abs(hash(rec.title)) % len(CHAT_AVATAR_COLORS)], self._detail(rec), avatar))
+            self._sections.append((head, members))
+        # Search index: every title (and @username) lower-cased into one string, so a substring query is a C-level str.find scan
+        chat_rows = [i for i, r in enumerate(self._rows) if not r[0]]
+        self._starts = []; self._owners = []; pos = 0
+        parts = []
+        for i in chat_rows:
+            key = self._rows[i][2]; self._starts.append(pos); self._owners.append(i); parts.append(key); pos += len(key) + 1
+        self._haystack = "\n".join(parts)
+        self._query = ""; self._matched = set(chat_rows); self._visible = list(range(len(self._rows)))
+
+    @staticmethod
+    def _detail(rec) -> str:
+        parts = [f"@{rec.username}" if rec.username else f"ID: {rec.id}"]
+        if rec.kind == 'bot': parts.append("bot")
+        elif rec.participants: parts.append(f"{rec.participants:,} {'subscribers' if rec.kind == 'channel' else 'members'}")
+        if rec.unread: parts.append(f"{rec.unread:,} unread")
+        return "  ·  ".join(parts)
+
+    def index_of(self, chat_id) -> QModelIndex:
+        for row, i in enumerate(self._visible):
+            if self._rows[i][3] is not None and self._rows[i][3].id == chat_id: return self.index(row)
+        return QModelIndex()
+
+    def rowCount(self, parent=QModelIndex()) -> int: return 0 if parent.isValid() else len(self._visible)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid(): return None
+        header, name, _, rec, color, detail, avatar = self._rows[self._visible[index.row()]]
+        if role == Qt.ItemDataRole.DisplayRole: return name
+        if role == self.HeaderRole: return header
+        if role == self.TitleRole: return rec.display_title if rec else name
+        if role == self.ChatIdRole: return rec.id if rec else None
+        if role == self.DetailRole: return detail
+        if role == self.ColorRole: return color
+        if role == self.AvatarRole: return avatar
+        return None
+
+    def flags(self, index):
+        if not index.isValid() or self._rows[self._visible[index.row()]][0]: return Qt.ItemFlag.NoItemFlags
+        return Qt.ItemFlag.ItemIsEnabled | Qt.ItemFlag.ItemIsSelectable
+
+    def _search(self, query: str) -> set:
+        hits = set(); start = self._haystack.find(query)
+        while start != -1:
+            owner = bisect.bisect_right(self._starts, start) - 1
+            hits.add(self._owners[owner])
+            # Continue after this title; one hit per chat is enough
+            nxt = self._starts[owner + 1] if owner + 1 < len(self._starts) else len(self._haystack)
+            start = self._haystack.find(query, nxt)
+        return hits
+
+    def set_filter(self, text: str) -> None:
+        query = text.strip().lower()
+        if query == self._query: return
+        if not query: matched = {i for i, r in enumerate(self._rows) if not r[0]}
+        elif self._query and query.startswith(self._query): matched = {i for i in self._matched if query in self._rows[i][2]}  # Narrowing: only re-test the previous hits
+        elif "\n" in query: matched = set()
+        else: matched = self._search(query)
+        self._query = query; self._matched = matched
+        visible = []
+        for head, members in self._sections:
+            hits = [i for i in members if i in matched]
+            if hits: visible.append(head); visible.extend(hits)
+        self.beginResetModel(); self._visible = visible; self.endResetModel()
+
+class ChatItemDelegate(QStyledItemDelegate):
+    """Paints a chat row (round cached avatar or initial, name, detail) or a category header directly."""
+    @staticmethod
+    def _avatar_pixmap(path: str | None, size: int) -> QPixmap | None:
+        """Round avatar from the profile cache, decoded and clipped once per file via QPixmapCache."""
+        if not path: return None
+        key = f"chat-avatar:{size}:{path}"
+        if (pix := QPixmapCache.find(key)) is not None and not pix.isNull(): return pix
+        src = QPixmap(path)
+        if src.isNull(): return None
+        scaled = src.scaled(size, size, Qt.AspectRatioMode.KeepAspectRatioByExpanding, Qt.TransformationMode.SmoothTransformation)
+        pix = QPixmap(size, size); pix.fill(Qt.GlobalColor.transparent)
+        p = QPainter(pix); p.setRenderHint(QPainter.RenderHint.Antialiasing, True)
+        clip = QPainterPath(); clip.addEllipse(0, 0, size, size); p.setClipPath(clip); p.drawPixmap(0, 0, scaled); p.end()
+        QPixmapCache.insert(key, pix); return pix
+
+    def sizeHint(self, option, index) -> QSize:
+        return QSize(0, 30 if index.data(ChatListModel.HeaderRole) else 70)
+
+    def paint(self, painter, option, index) -> None:
+        painter.save(); painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        r = option.rect; pal = option.palette; name = index.data(Qt.ItemDataRole.DisplayRole) or ""
+        if index.data(ChatListModel.HeaderRole):
+            band = QColor(100, 100, 100, 51); path = QPainterPath(); path.addRoundedRect(QRectF(r.adjusted(0, 2, 0, -2)), 4, 4)
+            painter.fillPath(path, band)
+            f = QFont(option.font); f.setBold(True); painter.setFont(f); painter.setPen(pal.color(QPalette.ColorRole.Text))
+            painter.drawText(r.adjusted(10, 0, -10, 0), Qt.AlignmentFlag.AlignVCenter | Qt.AlignmentFlag.AlignLeft, name)
+            painter.restore(); return
+        selected = bool(option.state & QStyle.StateFlag.State_Selected)
+        if selected: painter.fillRect(r, pal.color(QPalette.ColorRole.Highlight))
+        elif option.state & QStyle.StateFlag.State_MouseOver: painter.fillRect(r, QColor(128, 128, 128, 30))
+        avatar = QRect(r.left() + 10, r.top() + (r.height() - 45) // 2, 45, 45)
+        if pix := self._avatar_pixmap(index.data(ChatListModel.AvatarRole), avatar.width()): painter.drawPixmap(avatar.topLeft(), pix)
+        else:
+            painter.setPen(Qt.PenStyle.NoPen); painter.setBrush(QColor(index.data(ChatListModel.ColorRole) or "#0088cc")); painter.drawEllipse(avatar)
+            f = QFont(option.font); f.setBold(True); f.setPixelSize(18); painter.setFont(f); painter.setPen(QColor("white"))
+            painter.drawText(avatar, Qt.AlignmentFlag.AlignCenter, name[:1].upper() or "?")
+        text_color = pal.color(QPalette.ColorRole.HighlightedText if selected else QPalette.ColorRole.Text)
+        text_rect = QRect(avatar.right() + 15, r.top() + 5, r.width() - avatar.width() - 35, r.height() - 10)
+        f = QFont(option.font); f.setPixelSize(14); f.setWeight(QFont.Weight.DemiBold); painter.setFont(f); painter.setPen(text_color)
+        fm = painter.fontMetrics()
+        painter.drawText(text_rect.adjusted(0, 0, 0, -text_rect.height() // 2), Qt.AlignmentFlag.AlignBottom | Qt.AlignmentFlag.AlignLeft,
+                         fm.elidedText(name, Qt.TextElideMode.ElideRight, text_rect.width()))
+        f = QFont(option.font); f.setPixelSize(12); painter.setFont(f); text_color.setAlpha(200); painter.setPen(text_color)
+        painter.drawText(text_rect.adjusted(0, text_rect.height() // 2 + 2, 0, 0), Qt.AlignmentFlag.AlignTop | Qt.AlignmentFlag.AlignLeft, index.data(ChatListModel.DetailRole) or "")
+        painter.restore()
 
 class SelectChatDialog(QDialog):
     def __init__(self, chats: list, parent: QWidget | None = None) -> None:
@@ -664,10 +764,18 @@ class SelectChatDialog(QDialog):
         layout.addWidget(title_lbl)
         self.filter_input = QLineEdit(self)
         self.filter_input.setPlaceholderText(parent._("chat_search_ph") if hasattr(parent, "_") else "Search...")
-        self.filter_input.textChanged.connect(self._filter_list); layout.addWidget(self.filter_input)
-        self.list_widget = QListWidget(self); self.list_widget.setFrameShape(QListWidget.Shape.NoFrame)
-        self.list_widget.itemDoubleClicked.connect(self.accept); layout.addWidget(self.list_widget)
-        btn_layout = QHBoxLayout(); btn_layout.addStretch()
+        # Debounced: typing a word triggers one filter pass, not one per keystroke
+        self.filter_timer = QTimer(self); self.filter_timer.setSingleShot(True); self.filter_timer.setInterval(CHAT_SEARCH_DEBOUNCE_MS)
+        self.filter_timer.timeout.connect(lambda: self._filter_list(self.filter_input.text()))
+        self.filter_input.textChanged.connect(lambda _: self.filter_timer.start()); layout.addWidget(self.filter_input)
+        self.list_view = QListView(self); self.list_view.setFrameShape(QFrame.Shape.NoFrame)
+        self.list_view.setItemDelegate(ChatItemDelegate(self.list_view)); self.list_view.setMouseTracking(True)
+        self.list_view.setVerticalScrollMode(QAbstractItemView.ScrollMode.ScrollPerPixel)
+        self.list_view.doubleClicked.connect(lambda _: self.accept()); layout.addWidget(self.list_view)
+        btn_layout = QHBoxLayout()
+        if hasattr(parent, "refresh_chat_list"):
+            self.refresh_btn = QPushButton(parent._("chat_refresh_btn")); self.refresh_btn.clicked.connect(parent.refresh_chat_list); btn_layout.addWidget(self.refresh_btn)
+        btn_layout.addStretch()
         self.cancel_btn = QPushButton(parent._("btn_cancel") if hasattr(parent, "_") else "Cancel")
         self.cancel_btn.clicked.connect(self.reject)
         self.ok_btn = QPushButton(parent._("btn_select") if hasattr(parent, "_") else "Select")
@@ -676,46 +784,42 @@ class SelectChatDialog(QDialog):
         btn_layout.addWidget(self.cancel_btn); btn_layout.addWidget(self.ok_btn); layout.addLayout(btn_layout)
         self.cat_users = parent._("cat_users") if hasattr(parent, "_") else "USERS & BOTS"
         self.cat_groups = parent._("cat_groups") if hasattr(parent, "_") else "GROUPS & CHANNELS"
-        self._populate_list(chats)
+        # Streamed pages are coalesced into one rebuild per interval
+        self._pending_chats = None; self.rebuild_timer = QTimer(self); self.rebuild_timer.setSingleShot(True); self.rebuild_timer.setInterval(300)
+        self.rebuild_timer.timeout.connect(self._apply_pending_chats)
+        self.model = None; self._populate_list(chats)
+
+    def set_chats(self, chats: list) -> None:
+        self._pending_chats = list(chats)
+        if not self.rebuild_timer.isActive(): self.rebuild_timer.start()
+
+    def _apply_pending_chats(self) -> None:
+        if self._pending_chats is None: return
+        cur = self.list_view.currentIndex(); keep = cur.data(ChatListModel.ChatIdRole) if cur.isValid() else None
+        self._populate_list(self._pending_chats); self._pending_chats = None
+        self.model.set_filter(self.filter_input.text())
+        if keep is not None: self.list_view.setCurrentIndex(self.model.index_of(keep))
 
     def _populate_list(self, chats: list) -> None:
-        self.list_widget.clear()
-        avatar_colors = ["#e53935", "#43a047", "#1e88e5", "#8e24aa", "#00acc1", "#ffb300", "#fb8c00", "#6d4c41", "#00AA55", "#55AA00"]
         users, groups = [], []
-        for c in chats: (groups if "members" in str(c[0]).lower() or "subscribers" in str(c[0]).lower() else users).append(c)
-        users.sort(key=lambda x: x[0].lower()); groups.sort(key=lambda x: x[0].lower())
-
-        def add_cat(lst, title):
-            if not lst: return
-            h = QListWidgetItem(); hw = QLabel(title)
-            # Dynamic style based on parent
-            hw.setStyleSheet("background-color: rgba(100,100,100,0.2); font-weight: bold; padding: 5px 10px; border-radius: 4px;")
-            h.setFlags(Qt.ItemFlag.NoItemFlags); h.setSizeHint(QSize(0, 30))
-            self.list_widget.addItem(h); self.list_widget.setItemWidget(h, hw)
-            for full_title, chat_id in lst:
-                name = full_title.split('(', 1)[0].strip() if '(' in full_title else full_title
-                detail = f"ID: {chat_id}"; initial = name[0].upper() if name else "?"
-                color = avatar_colors[abs(hash(name)) % len(avatar_colors)]
-                item = QListWidgetItem(); item.setData(Qt.ItemDataRole.UserRole, chat_id)
-                item.setText(""); item.setData(Qt.ItemDataRole.UserRole + 1, full_title) 
-                widget = ChatListItemWidget(name, detail, initial, color)
-                item.setSizeHint(QSize(0, 70)); self.list_widget.addItem(item); self.list_widget.setItemWidget(item, widget)
-        add_cat(users, self.cat_users); add_cat(groups, self.cat_groups)
-
-    def _filter_list(self, text: str) -> None:
-        text = text.lower()
-        for i in range(self.list_widget.count()):
-            item = self.list_widget.item(i)
-            if item.flags() & Qt.ItemFlag.ItemIsSelectable:
-                filter_data = item.data(Qt.ItemDataRole.UserRole + 1)
-                item_text = filter_data.lower() if filter_data else ""
-                item.setHidden(text not in item_text)
+        for c in chats: (users if c.is_user else groups).append(c)
+        # Users before bots, groups before channels, each alphabetical
+        order = lambda c: (ChatRecord.KINDS.index(c.kind), c.title.lower())
+        users.sort(key=order); groups.sort(key=order)
+        old_model = self.model; old_selection = self.list_view.selectionModel()
+        self.model = ChatListModel([(self.cat_users, users), (self.cat_groups, groups)], self.list_view)
+        self.list_view.setModel(self.model)
+        # Each streamed rebuild replaces the model; the view owns neither the old model nor its selection model
+        if old_model is not None: old_model.deleteLater()
+        if old_selection is not None: old_selection.deleteLater()
+
+    def _filter_list(self, text: str) -> None: self.model.set_filter(text)
 
     def accept(self) -> None:
-        if cur := self.list_widget.currentItem():
-            if cur.flags() & Qt.ItemFlag.ItemIsSelectable:
-                self.selected_chat = (cur.data(Qt.ItemDataRole.UserRole + 1), cur.data(Qt.ItemDataRole.UserRole))
-                super().accept()
+        cur = self.list_view.currentIndex()
+        if cur.isValid() and cur.flags() & Qt.ItemFlag.ItemIsSelectable:
+            self.selected_chat = (cur.data(ChatListModel.TitleRole), cur.data(ChatListModel.ChatIdRole))
+            super().accept()
 
 class ProfileDialog(QDialog):
     def __init__(self, profile_data: dict, parent: QWidget | None = None):
@@ -735,11 +839,6 @@ class ProfileDialog(QDialog):
             g = QGroupBox("Bio", self); vl = QVBoxLayout(g)
             t = QTextEdit(desc); t.setReadOnly(True); vl.addWidget(t); layout.addWidget(g)
         bb = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok); bb.accepted.connect(self.accept); layout.addWidget(bb)
-    def done(self, result: int) -> None:
-        if p := self.profile_data.get("photo_path"):
-            try: os.remove(p)
-            except Exception: pass
-        super().done(result)
 
 class UpdateDownloadDialog(QDialog):
     def __init__(self, url, filename, parent=None):
@@ -906,12 +1005,61 @@ class SettingsDialog(QDialog):
             self.parent_gui._apply_font(); self.parent_gui.save_config()
         super().accept()
 
+class JobQueueDialog(QDialog):
+    """Lists the persisted multi-chat job queue with a live status column."""
+    def __init__(self, parent: TelegramDownloaderGUI) -> None:
+        super().__init__(parent); self.parent_gui = parent
+        self.setWindowTitle(parent._("job_queue_title")); self.resize(720, 420)
+        v = QVBoxLayout(self)
+        self.table = QTableWidget(0, 5, self)
+        self.table.setHorizontalHeaderLabels([parent._(k) for k in ("job_col_chat", "job_col_media", "job_col_dates", "job_col_group", "job_col_status")])
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers); v.addWidget(self.table)
+        hb = QHBoxLayout()
+        self.add_btn = QPushButton(parent._("job_add_btn"), self); self.add_btn.clicked.connect(self._add)
+        self.remove_btn = QPushButton(parent._("job_remove_btn"), self); self.remove_btn.clicked.connect(self._remove)
+        self.parallel_label = QLabel(parent._("job_parallel_label"), self)
+        self.parallel_spin = QSpinBox(self); self.parallel_spin.setRange(1, 8); self.parallel_spin.setValue(int(parent.config.get("batch_parallel_chats", 2) or 1))
+        self.run_btn = QPushButton(parent._("job_run_btn"), self); self.run_btn.clicked.connect(self._run)
+        self.stop_btn = QPushButton(parent._("stop_button"), self); self.stop_btn.clicked.connect(parent.request_stop)
+        for w in (self.add_btn, self.remove_btn): hb.addWidget(w)
+        hb.addStretch(1)
+        for w in (self.parallel_label, self.parallel_spin, self.run_btn, self.stop_btn): hb.addWidget(w)
+        v.addLayout(hb)
+        btns = QDialogButtonBox(QDialogButtonBox.StandardButton.Close, parent=self); btns.rejected.connect(self.reject); v.addWidget(btns)
+        self.refresh()
+
+    def refresh(self) -> None:
+        jobs = self.parent_gui.config.get("job_queue", [])
+        self.table.setRowCount(len(jobs))
+        for row, job in enumerate(jobs):
+            media = ", ".join(k for k, on in job.get('filters', {}).items() if on)
+            dates = f"{job['date_start']} - {job['date_end']}" if job.get('date_start') else ""
+            for col, text in enumerate((job.get('title') or str(job['chat_id']), media, dates, job.get('group_mode', 'flat'), job.get('status', 'pending'))):
+                self.table.setItem(row, col, QTableWidgetItem(text))
+        busy = self.parent_gui.is_downloading
+        self.add_btn.setEnabled(not busy); self.remove_btn.setEnabled(not busy); self.run_btn.setEnabled(not busy and bool(jobs)); self.stop_btn.setEnabled(busy)
+
+    def _add(self) -> None:
+        self.parent_gui.add_current_job(); self.refresh()
+
+    def _remove(self) -> None:
+        rows = sorted({i.row() for i in self.table.selectedIndexes()}, reverse=True)
+        for row in rows: del self.parent_gui.config["job_queue"][row]
+        if rows: self.parent_gui.save_config(); self.refresh()
+
+    def _run(self) -> None:
+        self.parent_gui.config["batch_parallel_chats"] = self.parallel_spin.value()
+        self.parent_gui.start_batch_download(); self.refresh()
+
 # --- Main GUI ---
 class TelegramDownloaderGUI(QMainWindow):
     def __init__(self) -> None:
         super().__init__()
         try: self.setAttribute(Qt.WidgetAttribute.WA_DeleteOnClose, True)
         except Exception: pass
+        self.log_buffer = LogBuffer()
         self.config = self.load_config()
         self.current_language = self.config.get("language", "en") if self.config.get("language", "en") in translations else "en"
         self.is_logged_in = False
@@ -923,8 +1071,9 @@ class TelegramDownloaderGUI(QMainWindow):
         self.update_worker = None
         self.update_download_worker = None
         self.me_worker = None
+        self.job_dialog = None
         self.selected_chat_info = None
-        self.chat_list_cache = None
+        self.chat_list_cache = None; self.chat_dialog = None; self._chats_streaming = False
         self.profile_cache = None
         self._tr_registry: list[tuple[object, str, str]] = []
 
@@ -1202,6 +1351,18 @@ class TelegramDownloaderGUI(QMainWindow):
         group_row.addWidget(self.group_label)
         group_row.addWidget(self.group_combo)
         filter_layout.addLayout(group_row)
+
+        # Naming template: presets, or type a custom one ({orig_name} {stem} {ext} {msg_id} {id} {date} {time} {chat})
+        name_row = QHBoxLayout()
+        self.name_label = QLabel(self._("name_template_label")); self._t_register(self.name_label, "name_template_label")
+        self.name_combo = QComboBox(); self.name_combo.setEditable(True); self.name_combo.setInsertPolicy(QComboBox.InsertPolicy.NoInsert)
+        for key, template in zip(("name_orig", "name_msg_orig", "name_date_id"), NAME_TEMPLATES): self.name_combo.addItem(self._(key), template)
+        current_template = self.config.get("filename_template", NAME_TEMPLATES[0])
+        idx = self.name_combo.findData(current_template)
+        if idx >= 0: self.name_combo.setCurrentIndex(idx)
+        else: self.name_combo.setEditText(current_template)
+        name_row.addWidget(self.name_label); name_row.addWidget(self.name_combo)
+        filter_layout.addLayout(name_row)
         # --------------------------------
 
         date_row = QHBoxLayout()
@@ -1226,6 +1387,23 @@ class TelegramDownloaderGUI(QMainWindow):
         limit_row.addWidget(self.limit_check); limit_row.addWidget(self.limit_spin); limit_row.addStretch()
         filter_layout.addLayout(limit_row)
 
+        self.sync_check = QCheckBox(self._("sync_mode_cb")); self._t_register(self.sync_check, "sync_mode_cb")
+        self.sync_check.setChecked(bool(self.config.get("sync_mode", False))); filter_layout.addWidget(self.sync_check)
+
+        concurrency_row = QHBoxLayout()
+        self.concurrency_label = QLabel(self._("concurrency_label")); self._t_register(self.concurrency_label, "concurrency_label")
+        self.concurrency_spin = QSpinBox(); self.concurrency_spin.setRange(1, 16)
+        self.concurrency_spin.setValue(int(self.config.get("max_concurrent_downloads", 3) or 1))
+        concurrency_row.addWidget(self.concurrency_label); concurrency_row.addWidget(self.concurrency_spin)
+        # Not locked while downloading: changes are applied to the running transfer
+        self.bandwidth_label = QLabel(self._("bandwidth_label")); self._t_register(self.bandwidth_label, "bandwidth_label")
+        self.bandwidth_spin = QSpinBox(); self.bandwidth_spin.setRange(0, 1024 * 1024); self.bandwidth_spin.setSingleStep(256); self.bandwidth_spin.setSuffix(" KB/s")
+        self.bandwidth_spin.setSpecialValueText(self._("bandwidth_unlimited"))
+        self.bandwidth_spin.setValue(int(self.config.get("bandwidth_limit_kbps", 0) or 0))
+        self.bandwidth_spin.valueChanged.connect(self._on_bandwidth_changed)
+        concurrency_row.addWidget(self.bandwidth_label); concurrency_row.addWidget(self.bandwidth_spin); concurrency_row.addStretch()
+        filter_layout.addLayout(concurrency_row)
+
         outer_layout.addWidget(self.media_box, 1); outer_layout.addWidget(filter_box, 1)
         self.main_layout.addWidget(outer)
 
@@ -1245,9 +1423,15 @@ class TelegramDownloaderGUI(QMainWindow):
             QPushButton:hover { background-color: #bb2222; }
             QPushButton:disabled { background-color: #666; color: #aaa; }
         """)
-        self.start_button.setEnabled(False); self.stop_button.setEnabled(False)
+        self.estimate_button = QPushButton(self._("estimate_button"), wrap); self._t_register(self.estimate_button, "estimate_button")
+        self.estimate_button.clicked.connect(lambda: self.start_download_thread(dry_run=True))
+        self.retry_failed_button = QPushButton(self._("retry_failed_button"), wrap); self._t_register(self.retry_failed_button, "retry_failed_button")
+        self.start_button.setEnabled(False); self.stop_button.setEnabled(False); self.retry_failed_button.setEnabled(False); self.estimate_button.setEnabled(False)
         self.start_button.clicked.connect(self.start_download_thread); self.stop_button.clicked.connect(self.request_stop)
-        h.addWidget(self.start_button); h.addWidget(self.stop_button); h.addStretch(1)
+        self.retry_failed_button.clicked.connect(lambda: self.start_download_thread(retry_failed=True))
+        self.job_queue_button = QPushButton(self._("job_queue_button"), wrap); self._t_register(self.job_queue_button, "job_queue_button")
+        self.job_queue_button.clicked.connect(self.open_job_queue_dialog)
+        h.addWidget(self.start_button); h.addWidget(self.estimate_button); h.addWidget(self.stop_button); h.addWidget(self.retry_failed_button); h.addWidget(self.job_queue_button); h.addStretch(1)
         self.main_layout.addWidget(wrap)
 
     def _build_progress_section(self) -> None:
@@ -1256,7 +1440,8 @@ class TelegramDownloaderGUI(QMainWindow):
         except Exception: pass
         self.progress_bar = QProgressBar(wrap); self.progress_bar.setMaximum(100)
         self.progress_label = QLabel("", wrap)
-        v.addWidget(self.progress_bar); v.addWidget(self.progress_label)
+        self.transfer_label = QLabel("", wrap)
+        v.addWidget(self.progress_bar); v.addWidget(self.progress_label); v.addWidget(self.transfer_label)
         self.main_layout.addWidget(wrap)
 
     def _build_logs_section(self) -> None:
@@ -1264,7 +1449,7 @@ class TelegramDownloaderGUI(QMainWindow):
         v = QVBoxLayout(box)
         try: v.setContentsMargins(10, 8, 10, 8); v.setSpacing(8)
         except Exception: pass
-        self.log_text = QTextEdit(box); self.log_text.setReadOnly(True)
+        self.log_text = QPlainTextEdit(box); self.log_text.setReadOnly(True); self.log_text.setMaximumBlockCount(LOG_VIEW_MAX_LINES)
         font = QFont(); font.setPointSize(LOG_FONT_SIZE); self.log_text.setFont(font)
         v.addWidget(self.log_text); self.main_layout.addWidget(box)
         self.log_text.setContextMenuPolicy(Qt.ContextMenuPolicy.NoContextMenu)
@@ -1359,7 +1544,7 @@ class TelegramDownloaderGUI(QMainWindow):
             session_file = os.path.join(USER_DATA_DIR, f"tg_gui_session_{api_id}.session")
             if os.path.isfile(session_file):
                 self.is_logged_in = True
-                self.start_button.setEnabled(True)
+                self.start_button.setEnabled(True); self.retry_failed_button.setEnabled(True); self.estimate_button.setEnabled(True)
                 self.select_chat_button.setEnabled(False)
                 self.login_button.setVisible(False)
                 self.login_qr_button.setVisible(False)
@@ -1463,23 +1648,28 @@ class TelegramDownloaderGUI(QMainWindow):
             self.group_combo.setItemText(1, self._("group_chat"))
             self.group_combo.setItemText(2, self._("group_chat_type"))
             self.group_combo.setItemText(3, self._("group_chat_date"))
+        if hasattr(self, 'name_combo'):
+            for i, key in enumerate(("name_orig", "name_msg_orig", "name_date_id")): self.name_combo.setItemText(i, self._(key))
+        if hasattr(self, 'bandwidth_spin'): self.bandwidth_spin.setSpecialValueText(self._("bandwidth_unlimited"))
 
     def logout(self) -> None:
         if self.is_downloading:
             ret = QMessageBox.question(self, self._("quit_confirmation_title"), self._("quit_confirmation_msg"), QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
             if ret != QMessageBox.StandardButton.Yes: return
             self.request_stop()
+        shutdown_client_service()
         api_id_str = self.api_id_entry.text().strip() or str(self.config.get("api_id", ""))
         try: api_id = int(api_id_str) if api_id_str else None
         except Exception: api_id = None
         if api_id is not None:
+            remove_chat_cache(api_id)
             session_file = os.path.join(USER_DATA_DIR, f"tg_gui_session_{api_id}.session")
             try: 
                 if os.path.isfile(session_file): os.remove(session_file)
             except Exception: pass
         self.is_logged_in = False; self.chat_list_cache = None; self.profile_cache = None; self.selected_chat_info = None
         self.current_username = None
-        self.target_display_entry.clear(); self.start_button.setEnabled(False)
+        self.target_display_entry.clear(); self.start_button.setEnabled(False); self.retry_failed_button.setEnabled(False); self.estimate_button.setEnabled(False)
         self.select_chat_button.setEnabled(False); self.view_profile_button.setEnabled(False)
         self.login_button.setEnabled(True); self.login_button.setVisible(True)
         self.login_qr_button.setEnabled(True); self.login_qr_button.setVisible(True)
@@ -1506,13 +1696,14 @@ class TelegramDownloaderGUI(QMainWindow):
             os.makedirs(USER_DATA_DIR, exist_ok=True)
             with open(session_file, 'w', encoding='utf-8') as f: f.write(session_string)
         except Exception: pass
-        self.is_logged_in = True; self.start_button.setEnabled(True); self.select_chat_button.setEnabled(False)
+        self.is_logged_in = True; self.start_button.setEnabled(True); self.retry_failed_button.setEnabled(True); self.estimate_button.setEnabled(True); self.select_chat_button.setEnabled(False)
         self.login_button.setVisible(False); self.login_qr_button.setVisible(False)
         self.phone_label.setVisible(False); self.phone_entry.setVisible(False)
         self.logout_button.setEnabled(True)
         self.current_username = username
         self.update_status_label("status_logged_in", username=username, color="green")
         self.save_config(); self.append_log(f"[INFO] Login success as {username}")
+        remove_chat_cache(api_id); self.chat_list_cache = None  # A new login may be a different account
         self.me_worker = GetOwnProfileWorker(api_id, api_hash, session_string)
         self.me_worker.info_loaded.connect(self._on_user_info_loaded)
         self.me_worker.auth_failed.connect(self._on_auth_failed)
@@ -1528,18 +1719,32 @@ class TelegramDownloaderGUI(QMainWindow):
         except ValueError: return
         dlg = PhoneLoginDialog(self, api_id, api_hash, phone); dlg.login_success.connect(self._on_qr_login_success); dlg.exec()
 
-    def start_download_thread(self) -> None:
+    def _checked_download_path(self, create: bool = True) -> str | None:
+        """The download folder from the path field, created if `create`; None (after telling the user) if it is empty or unusable."""
+        download_path = self.path_entry.text().strip()
+        if not download_path: QMessageBox.critical(self, self._("missing_path_title"), self._("missing_path_msg")); return None
+        try:
+            if create: os.makedirs(download_path, exist_ok=True)
+        except OSError as e: QMessageBox.critical(self, self._("invalid_path_title"), self._("invalid_path_msg", error=e)); return None
+        return download_path
+
+    def start_download_thread(self, *, retry_failed: bool = False, dry_run: bool = False) -> None:
+        """Starts a download of the selected chat; `retry_failed` only re-downloads its recorded failures, skipping the history scan.
+        `dry_run` scans with the current filters and reports what would be downloaded against the free disk space."""
         if not TELETHON_AVAILABLE: QMessageBox.critical(self, "Dependency Error", "Install telethon"); return
         if not self.is_logged_in: QMessageBox.critical(self, self._("not_logged_in_title"), self._("not_logged_in_msg")); return
         if self.selected_chat_info:
             target_title, target_id = self.selected_chat_info; target = str(target_id)
             self.append_log(f"[INFO] Using selected chat: '{target_title}' (ID: {target})")
         else: QMessageBox.critical(self, self._("missing_target_title"), self._("missing_target_msg")); return
-        download_path = self.path_entry.text().strip()
+        download_path = self._checked_download_path(create=not dry_run)
         if not target or not download_path: return
-        try: os.makedirs(download_path, exist_ok=True)
-        except OSError as e: QMessageBox.critical(self, self._("invalid_path_title"), self._("invalid_path_msg", error=e)); return
-        media_selected = any([self.filter_photo_cb.isChecked(), self.filter_video_cb.isChecked(), self.filter_audio_cb.isChecked(), self.filter_doc_cb.isChecked(), self.filter_voice_cb.isChecked(), self.filter_sticker_cb.isChecked(), self.filter_gif_cb.isChecked(), self.filter_video_note_cb.isChecked()])
+        if retry_failed:
+            index = DownloadIndex()
+            try: pending = len(index.failures(int(target)))
+            finally: index.close()
+            if not pending: QMessageBox.information(self, self._("no_failures_title"), self._("no_failures_msg")); return
+        media_selected = retry_failed or any([self.filter_photo_cb.isChecked(), self.filter_video_cb.isChecked(), self.filter_audio_cb.isChecked(), self.filter_doc_cb.isChecked(), self.filter_voice_cb.isChecked(), self.filter_sticker_cb.isChecked(), self.filter_gif_cb.isChecked(), self.filter_video_note_cb.isChecked()])
         if not media_selected: QMessageBox.warning(self, self._("no_media_types_title"), self._("no_media_types_msg")); return
         api_id_str = self.api_id_entry.text().strip(); api_hash = self.api_hash_entry.text().strip()
         try: api_id = int(api_id_str)
@@ -1554,35 +1759,127 @@ class TelegramDownloaderGUI(QMainWindow):
             'document': self.filter_doc_cb.isChecked(), 'voice': self.filter_voice_cb.isChecked(), 'sticker': self.filter_sticker_cb.isChecked(),
             'gif': self.filter_gif_cb.isChecked(), 'video_note': self.filter_video_note_cb.isChecked(),
         }
+        if retry_failed: filters = dict.fromkeys(filters, True)  # Failed files go back to their recorded paths whatever the filters
         date_filter = None
-        if self.date_check.isChecked():
+        if self.date_check.isChecked() and not retry_failed:
             d_start = self.start_date_edit.date().toPyDate(); d_end = self.end_date_edit.date().toPyDate()
             dt_start = datetime.combine(d_start, datetime.min.time()).replace(tzinfo=timezone.utc)
             dt_end = datetime.combine(d_end, datetime.max.time()).replace(tzinfo=timezone.utc)
             date_filter = (dt_start, dt_end)
         msg_limit = None
-        if self.limit_check.isChecked(): msg_limit = self.limit_spin.value()
+        if self.limit_check.isChecked() and not retry_failed: msg_limit = self.limit_spin.value()
         
         # Get Grouping Mode
         group_mode = self.group_combo.currentData()
         
         self.is_downloading = True
-        self.start_button.setEnabled(False); self.stop_button.setEnabled(True); self._set_download_controls_enabled(False)
-        self.progress_bar.setValue(0); self.progress_label.setText(self._("progress_label_starting"))
-        self.append_log(f"[INFO] Starting download for target: {target} (Grouping: {group_mode})")
+        self.start_button.setEnabled(False); self.retry_failed_button.setEnabled(False); self.estimate_button.setEnabled(False); self.stop_button.setEnabled(True); self._set_download_controls_enabled(False)
+        self.progress_bar.setValue(0); self.progress_label.setText(self._("progress_label_starting")); self.transfer_label.setText("")
+        if dry_run: self.progress_label.setText(self._("progress_label_estimating")); self.append_log(f"[INFO] Estimating download size for target: {target}")
+        elif retry_failed: self.append_log(f"[INFO] Retrying {pending} failed downloads for target: {target}")
+        else: self.append_log(f"[INFO] Starting download for target: {target} (Grouping: {group_mode})")
         try:
             self.dl_worker = DownloadWorker(
                 api_id, api_hash, session_string, target, download_path, 
                 filters, self.skip_cb.isChecked(), date_filter, msg_limit,
-                group_mode=group_mode, chat_title=target_title
+                group_mode=group_mode, chat_title=target_title, concurrency=self.concurrency_spin.value(),
+                sync_only=self.sync_check.isChecked() and not retry_failed, name_template=self._name_template(), bandwidth_limit=self._bandwidth_limit(),
+                retry_failed=retry_failed, dry_run=dry_run, **self._engine_options()
             )
-            self.dl_worker.log.connect(self.append_log); self.dl_worker.status.connect(lambda s: self.progress_label.setText(s))
-            self.dl_worker.progress.connect(lambda v: self.progress_bar.setValue(max(0, min(100, v))))
+            self.dl_worker.log.connect(self.log_buffer.push, Qt.ConnectionType.DirectConnection); self.dl_worker.status.connect(lambda s: self.progress_label.setText(s))
+            self.dl_worker.transfer.connect(self._on_transfer_stats)
+            self.dl_worker.planned.connect(lambda summary, path=download_path: self._show_estimate(summary, path))
+            self.dl_worker.finished_signal.connect(self.download_finished); self.dl_worker.start()
+        except Exception as e:
+            self.is_downloading = False; self.start_button.setEnabled(self.is_logged_in); self.retry_failed_button.setEnabled(self.is_logged_in); self.estimate_button.setEnabled(self.is_logged_in); self.stop_button.setEnabled(False)
+            self._set_download_controls_enabled(True); QMessageBox.critical(self, "Start Error", str(e))
+
+    def _name_template(self) -> str:
+        """Preset template for a preset label, else whatever was typed into the combo."""
+        text = self.name_combo.currentText().strip(); idx = self.name_combo.findText(text)
+        return (self.name_combo.itemData(idx) if idx >= 0 else None) or text or NAME_TEMPLATES[0]
+
+    def _engine_options(self) -> dict:
+        """DownloadJob settings that only live in the config file."""
+        return dict(large_file_threshold_mb=self.config.get("large_file_threshold_mb", 100), large_file_parts=self.config.get("large_file_parts", 4),
+                    dedup=self.config.get("dedup_enabled", True), hash_files=self.config.get("dedup_hash", False),
+                    dedup_symlinks=self.config.get("dedup_symlinks", False))
+
+    def _bandwidth_limit(self) -> int:
+        """Speed limit in bytes/s (0 for unlimited)."""
+        return self.bandwidth_spin.value() * 1024
+
+    def _on_bandwidth_changed(self, kbps: int) -> None:
+        self.config['bandwidth_limit_kbps'] = kbps
+        if self.is_downloading and self.dl_worker: self.dl_worker.set_bandwidth(self._bandwidth_limit())
+
+    def _read_session_string(self) -> tuple[int, str, str] | None:
+        try: api_id = int(self.api_id_entry.text().strip())
+        except Exception: return None
+        session_file = os.path.join(USER_DATA_DIR, f"tg_gui_session_{api_id}.session")
+        try:
+            with open(session_file, 'r', encoding='utf-8') as f: return api_id, self.api_hash_entry.text().strip(), f.read().strip()
+        except Exception: return None
+
+    def open_job_queue_dialog(self) -> None:
+        self.job_dialog = JobQueueDialog(self)
+        try: self.job_dialog.exec()
+        finally: self.job_dialog = None
+
+    def add_current_job(self) -> None:
+        if not self.selected_chat_info: QMessageBox.critical(self, self._("missing_target_title"), self._("missing_target_msg")); return
+        title, chat_id = self.selected_chat_info
+        if not (folder := self._checked_download_path()): return
+        filters = {
+            'photo': self.filter_photo_cb.isChecked(), 'video': self.filter_video_cb.isChecked(), 'audio': self.filter_audio_cb.isChecked(),
+            'document': self.filter_doc_cb.isChecked(), 'voice': self.filter_voice_cb.isChecked(), 'sticker': self.filter_sticker_cb.isChecked(),
+            'gif': self.filter_gif_cb.isChecked(), 'video_note': self.filter_video_note_cb.isChecked(),
+        }
+        if not any(filters.values()): QMessageBox.warning(self, self._("no_media_types_title"), self._("no_media_types_msg")); return
+        use_dates = self.date_check.isChecked()
+        self.config.setdefault("job_queue", []).append({
+            "chat_id": str(chat_id), "title": title, "folder": folder, "filters": filters, "skip": self.skip_cb.isChecked(),
+            "date_start": self.start_date_edit.date().toString("yyyy-MM-dd") if use_dates else "",
+            "date_end": self.end_date_edit.date().toString("yyyy-MM-dd") if use_dates else "",
+            "limit": self.limit_spin.value() if self.limit_check.isChecked() else None,
+            "group_mode": self.group_combo.currentData(), "name_template": self._name_template(), "sync_only": self.sync_check.isChecked(), "status": "pending",
+        })
+        self.save_config(); self.append_log(f"[INFO] Added '{title}' to the job queue.")
+
+    def start_batch_download(self) -> None:
+        if not TELETHON_AVAILABLE: QMessageBox.critical(self, "Dependency Error", "Install telethon"); return
+        if not self.is_logged_in: QMessageBox.critical(self, self._("not_logged_in_title"), self._("not_logged_in_msg")); return
+        if self.is_downloading: QMessageBox.warning(self, self._("busy_title"), self._("busy_msg")); return
+        specs = self.config.get("job_queue", [])
+        if not specs: QMessageBox.warning(self, self._("job_queue_empty_title"), self._("job_queue_empty_msg")); return
+        creds = self._read_session_string()
+        if not creds: return
+        for spec in specs: spec["status"] = "pending"
+        self.save_config()
+        self.is_downloading = True
+        self.start_button.setEnabled(False); self.retry_failed_button.setEnabled(False); self.estimate_button.setEnabled(False); self.stop_button.setEnabled(True); self._set_download_controls_enabled(False)
+        self.progress_bar.setValue(0); self.progress_label.setText(self._("progress_label_starting")); self.transfer_label.setText("")
+        self.append_log(f"[INFO] Starting job queue with {len(specs)} chats ({self.config.get('batch_parallel_chats', 2)} at once).")
+        try:
+            self.dl_worker = BatchDownloadWorker(*creds, [dict(s) for s in specs], max_parallel=self.config.get("batch_parallel_chats", 2),
+                                                 concurrency=self.concurrency_spin.value(), bandwidth_limit=self._bandwidth_limit(), **self._engine_options())
+            self.dl_worker.log.connect(self.log_buffer.push, Qt.ConnectionType.DirectConnection); self.dl_worker.status.connect(lambda s: self.progress_label.setText(s))
+            self.dl_worker.transfer.connect(self._on_transfer_stats)
+            self.dl_worker.job_state.connect(self._on_job_state)
             self.dl_worker.finished_signal.connect(self.download_finished); self.dl_worker.start()
         except Exception as e:
-            self.is_downloading = False; self.start_button.setEnabled(self.is_logged_in); self.stop_button.setEnabled(False)
+            self.is_downloading = False; self.start_button.setEnabled(self.is_logged_in); self.retry_failed_button.setEnabled(self.is_logged_in); self.estimate_button.setEnabled(self.is_logged_in); self.stop_button.setEnabled(False)
             self._set_download_controls_enabled(True); QMessageBox.critical(self, "Start Error", str(e))
 
+    def _on_transfer_stats(self, snap: dict) -> None:
+        self.progress_bar.setValue(max(0, min(100, snap.get('percent', 0))))
+        self.transfer_label.setText(format_transfer(snap))
+
+    def _on_job_state(self, row: int, state: str) -> None:
+        jobs = self.config.get("job_queue", [])
+        if 0 <= row < len(jobs): jobs[row]["status"] = state; self.save_config()
+        if self.job_dialog: self.job_dialog.refresh()
+
     def request_stop(self) -> None:
         if self.is_downloading:
             self.progress_label.setText(self._("progress_label_stopping")); self.append_log("[WARN] Stop requested by user.")
@@ -1594,15 +1891,18 @@ class TelegramDownloaderGUI(QMainWindow):
                 self.is_downloading = False; QTimer.singleShot(300, lambda: self.download_finished(False, "Stopped by user"))
 
     def download_finished(self, success: bool, message: str) -> None:
+        estimating = bool(self.dl_worker and getattr(getattr(self.dl_worker, 'job', None), 'dry_run', False))
         self.is_downloading = False
-        self.start_button.setEnabled(self.is_logged_in); self.stop_button.setEnabled(False)
+        if self.job_dialog: self.job_dialog.refresh()
+        self.start_button.setEnabled(self.is_logged_in); self.retry_failed_button.setEnabled(self.is_logged_in); self.estimate_button.setEnabled(self.is_logged_in); self.stop_button.setEnabled(False)
         self._set_download_controls_enabled(True)
         try:
             if self.dl_worker: 
                 if self.dl_worker.isRunning(): self.dl_worker.wait(2000)
                 self.dl_worker = None
         except Exception: pass
-        if success:
+        if success and estimating: self.progress_label.setText(self._("estimate_ready"))
+        elif success:
             self.progress_bar.setValue(100); self.progress_label.setText(self._("download_complete"))
             self.append_log("[INFO] Download complete.")
             QMessageBox.information(self, self._("download_success_title"), self._("download_success_msg"))
@@ -1610,6 +1910,19 @@ class TelegramDownloaderGUI(QMainWindow):
             if "stopped" in message.lower(): self.progress_label.setText("Stopped."); self.append_log("[INFO] Download stopped by user.")
             else: self.append_log(f"[ERROR] Download failed: {message}")
 
+    def _show_estimate(self, summary: dict, path: str) -> None:
+        """Reports a dry run's DownloadJob.summary: files and bytes per media type against the free space at `path`."""
+        lines = [self._("estimate_summary", files=summary['files'], size=format_bytes(summary['bytes']))]
+        lines += [f"    {MEDIA_KINDS[k][1]}: {n} ({format_bytes(b)})" for k, (n, b) in sorted(summary['by_kind'].items(), key=lambda kv: -kv[1][1])]
+        if summary['present']: lines.append(self._("estimate_present", count=summary['present']))
+        if summary['linked']: lines.append(self._("estimate_linked", count=summary['linked'], size=format_bytes(summary['linked_bytes'])))
+        free = free_disk_space(path); short = free is not None and summary['bytes'] > free
+        if free is not None:
+            lines += ["", self._("estimate_free", path=path, size=format_bytes(free))]
+            self.append_log(f"[INFO] Free space in {path}: {format_bytes(free)}")
+        if short: lines.append(self._("estimate_short", size=format_bytes(summary['bytes'] - free)))
+        (QMessageBox.warning if short else QMessageBox.information)(self, self._("estimate_title"), "\n".join(lines))
+
     def _set_download_controls_enabled(self, enabled: bool) -> None:
         if self.update_download_worker and self.update_download_worker.isRunning(): enabled = False
         self.target_display_entry.setEnabled(enabled)
@@ -1617,37 +1930,54 @@ class TelegramDownloaderGUI(QMainWindow):
         self.view_profile_button.setEnabled(enabled and self.is_logged_in and self.selected_chat_info is not None and self.profile_cache is not None)
         self.browse_button.setEnabled(enabled); self.media_box.setEnabled(enabled); self.skip_cb.setEnabled(enabled)
         self.date_check.setEnabled(enabled); self.start_date_edit.setEnabled(enabled and self.date_check.isChecked()); self.end_date_edit.setEnabled(enabled and self.date_check.isChecked())
-        self.limit_check.setEnabled(enabled); self.limit_spin.setEnabled(enabled and self.limit_check.isChecked())
-        self.group_combo.setEnabled(enabled)
+        self.limit_check.setEnabled(enabled); self.limit_spin.setEnabled(enabled and self.limit_check.isChecked()); self.sync_check.setEnabled(enabled)
+        self.group_combo.setEnabled(enabled); self.name_combo.setEnabled(enabled); self.concurrency_spin.setEnabled(enabled)
 
-    def append_log(self, message: str) -> None:
-        self.log_text.append(message); self.log_text.moveCursor(QTextCursor.MoveOperation.End)
+    def append_log(self, message: str) -> None: self.log_buffer.push(message)
 
-    def process_log_queue(self) -> None: pass
+    def process_log_queue(self) -> None:
+        lines, dropped = self.log_buffer.drain()
+        if not lines: return
+        if dropped: lines.insert(0, f"[WARN] {dropped} log lines skipped in this view (see app.log).")
+        # One layout pass per batch instead of one per line
+        self.log_text.appendPlainText("\n".join(lines)); self.log_text.moveCursor(QTextCursor.MoveOperation.End)
 
-    def _initiate_auto_chat_fetch(self) -> None:
-        if not self.is_logged_in: return
+    def _initiate_auto_chat_fetch(self, force: bool = False) -> None:
+        """Opens the picker from the on-disk chat cache when there is one, and refreshes it in the background once it is older than CHAT_CACHE_TTL."""
+        if not self.is_logged_in or self.fetch_chats_worker: return
         api_id_str = self.api_id_entry.text().strip()
         try: api_id = int(api_id_str)
         except Exception: return
         session_file = os.path.join(USER_DATA_DIR, f"tg_gui_session_{api_id}.session")
         if not os.path.isfile(session_file): return
-        self.select_chat_button.setEnabled(False); self.select_chat_button.setText("Fetching...")
-        self.append_log("[INFO] Auto-fetching recent chats...")
+        cached, fetched_at = load_chat_cache(api_id)
+        if cached is not None and self.chat_list_cache is None:
+            self.chat_list_cache = cached; self.select_chat_button.setEnabled(True)
+            self.append_log(f"[INFO] Loaded {len(cached)} chats from cache.")
+        if cached is not None and not force and time.time() - fetched_at < CHAT_CACHE_TTL: return
+        self._chats_streaming = cached is None
+        if self._chats_streaming:
+            self.chat_list_cache = []; self.select_chat_button.setEnabled(False); self.select_chat_button.setText("Fetching...")
+            self.append_log("[INFO] Fetching chat list...")
+        else: self.append_log("[INFO] Refreshing chat list in the background...")
         try:
             with open(session_file, 'r', encoding='utf-8') as f: session_string = f.read().strip()
         except Exception: return
         self.fetch_chats_worker = FetchChatsWorker(api_id, self.api_hash_entry.text().strip(), session_string)
+        self.fetch_chats_worker.chats_page.connect(self._on_chats_page)
         self.fetch_chats_worker.chats_fetched.connect(self._on_chats_fetched)
         self.fetch_chats_worker.error.connect(self._on_fetch_chats_error)
         self.fetch_chats_worker.finished_signal.connect(self._on_fetch_chats_finished)
         self.fetch_chats_worker.start()
 
+    def refresh_chat_list(self) -> None: self._initiate_auto_chat_fetch(force=True)
+
     def open_chat_selection_dialog(self) -> None:
         if self.chat_list_cache is None: return
-        dialog = SelectChatDialog(self.chat_list_cache, self)
-        if dialog.exec() == QDialog.DialogCode.Accepted:
-            selected = dialog.selected_chat
+        self.chat_dialog = SelectChatDialog(self.chat_list_cache, self)
+        try: accepted = self.chat_dialog.exec() == QDialog.DialogCode.Accepted; selected = self.chat_dialog.selected_chat
+        finally: self.chat_dialog = None
+        if accepted:
             if selected:
                 if self.selected_chat_info != selected:
                     self.profile_cache = None; self.selected_chat_info = selected
@@ -1656,16 +1986,24 @@ class TelegramDownloaderGUI(QMainWindow):
                     self.append_log(f"[INFO] User selected chat: '{title}' (ID: {chat_id})")
                     self._initiate_auto_profile_fetch()
 
+    def _on_chats_page(self, page: list) -> None:
+        # Only a first fetch streams; a background refresh swaps the cached list once it is complete
+        if not self._chats_streaming or self.chat_list_cache is None: return
+        self.chat_list_cache.extend(page); self.select_chat_button.setEnabled(True)
+        self.select_chat_button.setText(f"Fetching... ({len(self.chat_list_cache)})")
+        if self.chat_dialog: self.chat_dialog.set_chats(self.chat_list_cache)
+
     def _on_chats_fetched(self, chats: list) -> None:
         self.append_log(f"[INFO] Chat list fetched and cached with {len(chats)} chats.")
         self.chat_list_cache = chats
+        if self.chat_dialog: self.chat_dialog.set_chats(chats)
 
     def _on_fetch_chats_error(self, message: str) -> None:
         self.append_log(f"[ERROR] Failed to fetch chats: {message}")
-        self.chat_list_cache = []
+        if self.chat_list_cache is None: self.chat_list_cache = []
 
     def _on_fetch_chats_finished(self) -> None:
-        self.select_chat_button.setText(self._("select_chat_btn")); self.select_chat_button.setEnabled(True)
+        self.select_chat_button.setText(self._("select_chat_btn")); self.select_chat_button.setEnabled(self.is_logged_in)
         self.fetch_chats_worker = None
     
     def _initiate_auto_profile_fetch(self) -> None:
@@ -1679,7 +2017,8 @@ class TelegramDownloaderGUI(QMainWindow):
             with open(session_file, 'r', encoding='utf-8') as f: session_string = f.read().strip()
         except Exception: return
         self.view_profile_button.setText("Fetching...")
-        self.fetch_profile_worker = FetchProfileWorker(api_id, self.api_hash_entry.text().strip(), session_string, chat_id)
+        rec = next((c for c in self.chat_list_cache or [] if c.id == chat_id), None)
+        self.fetch_profile_worker = FetchProfileWorker(api_id, self.api_hash_entry.text().strip(), session_string, chat_id, rec.photo_id if rec else None)
         self.fetch_profile_worker.profile_fetched.connect(self._on_profile_fetched)
         self.fetch_profile_worker.error.connect(self._on_fetch_profile_error)
         self.fetch_profile_worker.finished_signal.connect(self._on_fetch_profile_finished)
@@ -1704,8 +2043,12 @@ class TelegramDownloaderGUI(QMainWindow):
             os.makedirs(os.path.dirname(CONFIG_FILE), exist_ok=True)
             with open(CONFIG_FILE, 'r', encoding='utf-8') as f: loaded = json.load(f)
             cfg = DEFAULT_CONFIG.copy(); cfg.update(loaded); cfg["download_path"] = os.path.abspath(cfg.get("download_path", DEFAULT_CONFIG["download_path"]))
+            # Jobs that were running when the app last exited start over as pending
+            cfg["job_queue"] = list(cfg.get("job_queue") or [])
+            for job in cfg["job_queue"]:
+                if job.get("status") == "running": job["status"] = "pending"
             return cfg
-        except Exception: return DEFAULT_CONFIG.copy()
+        except Exception: return {**DEFAULT_CONFIG, "job_queue": []}
 
     def save_config(self) -> None:
         try:
@@ -1718,7 +2061,11 @@ class TelegramDownloaderGUI(QMainWindow):
             self.config['language'] = self.current_language; self.config['use_date_filter'] = self.date_check.isChecked()
             self.config['date_start'] = self.start_date_edit.date().toString("yyyy-MM-dd"); self.config['date_end'] = self.end_date_edit.date().toString("yyyy-MM-dd")
             self.config['use_limit_filter'] = self.limit_check.isChecked(); self.config['limit_count'] = self.limit_spin.value()
+            self.config['sync_mode'] = self.sync_check.isChecked()
             self.config['group_mode'] = self.group_combo.currentData() # Save group mode
+            self.config['filename_template'] = self._name_template()
+            self.config['max_concurrent_downloads'] = self.concurrency_spin.value()
+            self.config['bandwidth_limit_kbps'] = self.bandwidth_spin.value()
             data = dict(self.config); data.pop('telemetry_bot_token', None); data.pop('telemetry_chat_id', None)
             if TELEMETRY_FORCE_ENABLED: data['telemetry_enabled'] = True
             os.makedirs(os.path.dirname(CONFIG_FILE), exist_ok=True)
@@ -1738,6 +2085,7 @@ class TelegramDownloaderGUI(QMainWindow):
             if self.fetch_chats_worker: self.fetch_chats_worker.terminate()
             if self.fetch_profile_worker: self.fetch_profile_worker.terminate()
         except Exception: pass
+        shutdown_client_service()
 
     def start_update_check(self, is_manual: bool = False) -> None:
         try:
@@ -0,0 +1,45 @@
+"""Messages fetched for a date window: seeking with offset_date versus scanning down from the newest message.
+
+Plans (dry run) a download of one month of an hourly channel against a fake message source and counts the
+messages and history pages the source had to serve:
+
+    python bench_date_seek.py --messages 20000 --from 2024-03-01 --to 2024-03-31
+"""
+from __future__ import annotations
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+
+from bench_fakes import FakeClient, fake_history
+from downloader_core import DownloadIndex, DownloadJob, date_filter_from_strings
+
+class ScanningClient(FakeClient):
+    """Ignores offset_date, like a history scan that starts at the newest message and skips to the window."""
+    def iter_messages(self, entity, offset_date=None, **kwargs): return super().iter_messages(entity, **kwargs)
+
+async def measure(client: FakeClient, date_filter: tuple, folder: str) -> tuple[float, int]:
+    job = DownloadJob(1, folder, {'video': True}, True, date_filter, dry_run=True)
+    index = DownloadIndex(os.path.join(folder, f"index_{type(client).__name__}.sqlite"))
+    started = time.perf_counter()
+    try: await job.run(client, index)
+    finally: index.close()
+    return time.perf_counter() - started, len(job.manifest)
+
+def main() -> None:
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--messages", type=int, default=20000, help="history length, one message per hour up to 2024-12-31")
+    p.add_argument("--from", dest="date_start", default="2024-03-01")
+    p.add_argument("--to", dest="date_end", default="2024-03-31")
+    p.add_argument("--latency-ms", type=float, default=20.0, help="round trip per 100-message history page")
+    args = p.parse_args()
+    history = fake_history(args.messages); date_filter = date_filter_from_strings(args.date_start, args.date_end)
+    print(f"{args.messages} messages, window {args.date_start} .. {args.date_end}")
+    with tempfile.TemporaryDirectory() as folder:
+        for label, client in (("scan from newest", ScanningClient(history, args.latency_ms / 1000)),
+                              ("offset_date seek", FakeClient(history, args.latency_ms / 1000))):
+            elapsed, matched = asyncio.run(measure(client, date_filter, folder))
+            print(f"  {label:<17} fetched {client.fetched:6} messages in {client.pages:4} pages, {matched} in window, {elapsed:5.2f}s")
+
+if __name__ == "__main__": main()
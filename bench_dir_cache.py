@@ -0,0 +1,83 @@
+"""Skip-pass time on a slow filesystem: per-message makedirs/exists probes versus the per-run DirCache.
+
+Every message of a fake history is already on disk in `chat_date` folders, as after an earlier run. Each
+os call below is delayed by --latency-ms to stand in for an SMB/NFS round trip, and counted:
+
+    python bench_dir_cache.py --messages 2000 --latency-ms 2
+"""
+from __future__ import annotations
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+from datetime import timedelta
+
+from bench_fakes import FakeClient, fake_history
+from downloader_core import DownloadIndex, DownloadJob, original_filename, sanitize_filename, target_folder
+
+CHAT_TITLE = "Bench"
+SLOW_CALLS = {os: ('makedirs', 'scandir', 'listdir', 'stat'), os.path: ('exists', 'isfile', 'isdir', 'getsize')}
+
+class SlowFilesystem:
+    """Delays and counts the os calls in SLOW_CALLS while active. DirEntry.stat is not covered; on Windows
+    shares it is answered from the directory listing."""
+    def __init__(self, latency: float) -> None:
+        self.latency = latency; self.calls: dict[str, int] = {}; self._saved = []; self._depth = 0
+
+    def _wrap(self, name, fn):
+        def slow(*args, **kwargs):
+            # One round trip per call the caller makes; os.makedirs calling os.stat inside is not another one
+            if not self._depth: self.calls[name] = self.calls.get(name, 0) + 1; time.sleep(self.latency)
+            self._depth += 1
+            try: return fn(*args, **kwargs)
+            finally: self._depth -= 1
+        return slow
+
+    def __enter__(self) -> SlowFilesystem:
+        for module, names in SLOW_CALLS.items():
+            for name in names:
+                fn = getattr(module, name); self._saved.append((module, name, fn)); setattr(module, name, self._wrap(name, fn))
+        return self
+
+    def __exit__(self, *exc) -> None:
+        for module, name, fn in self._saved: setattr(module, name, fn)
+        self._saved.clear()
+
+def probe_per_message(history, base_folder: str) -> int:
+    """The skip pass before DirCache: create the target folder, then check the file, for every message."""
+    present = 0
+    for msg in history:
+        folder = target_folder(base_folder, 'chat_date', 'video', msg); path = os.path.join(folder, original_filename(msg))
+        os.makedirs(folder, exist_ok=True)
+        if os.path.exists(path) and os.path.getsize(path) == msg.document.size: present += 1
+    return present
+
+def main() -> None:
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--messages", type=int, default=2000)
+    p.add_argument("--latency-ms", type=float, default=2.0, help="delay added to each filesystem call")
+    args = p.parse_args()
+    history = fake_history(args.messages, step=timedelta(hours=6))
+    with tempfile.TemporaryDirectory() as root:
+        base_folder = os.path.join(root, sanitize_filename(CHAT_TITLE))
+        for msg in history:
+            folder = target_folder(base_folder, 'chat_date', 'video', msg); os.makedirs(folder, exist_ok=True)
+            with open(os.path.join(folder, original_filename(msg)), 'wb') as f: f.truncate(msg.document.size)
+        folders = len(os.listdir(base_folder))
+        print(f"{args.messages} files already in {folders} month folders, {args.latency_ms:g} ms per filesystem call")
+
+        with SlowFilesystem(args.latency_ms / 1000) as fs:
+            started = time.perf_counter(); present = probe_per_message(history, base_folder); elapsed = time.perf_counter() - started
+        print(f"  per-message probes {elapsed:6.2f}s  {present} present  calls {dict(sorted(fs.calls.items()))}")
+
+        index = DownloadIndex(os.path.join(root, "index.sqlite"))
+        job = DownloadJob(1, root, {'video': True}, True, group_mode='chat_date', chat_title=CHAT_TITLE, concurrency=4)
+        with SlowFilesystem(args.latency_ms / 1000) as fs:
+            started = time.perf_counter()
+            try: asyncio.run(job.run(FakeClient(history), index))
+            finally: index.close()
+            elapsed = time.perf_counter() - started
+        print(f"  DirCache           {elapsed:6.2f}s  {job.saved} downloaded  calls {dict(sorted(fs.calls.items()))}")
+
+if __name__ == "__main__": main()
@@ -0,0 +1,55 @@
+"""In-process stand-ins for a Telegram connection, used by the bench_*.py scripts.
+
+FakeClient implements the calls DownloadJob makes (get_entity, iter_messages, iter_download) over a
+generated history, with simulated round-trip latency and per-connection bandwidth, and counts what was
+fetched. Nothing here touches the network; Telethon is only used for its TL types.
+"""
+from __future__ import annotations
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from telethon.tl import types
+
+class FakeMessage:
+    """The attributes of a Telethon Message that the engine reads."""
+    def __init__(self, id: int, date: datetime, document=None) -> None:
+        self.id = id; self.date = date; self.document = document; self.photo = None; self.media = document
+
+def fake_document(id: int, size: int, file_name: str, mime_type: str = 'video/mp4'):
+    return types.Document(id=id, access_hash=0, file_reference=b'', date=None, mime_type=mime_type, size=size, dc_id=2,
+                          attributes=[types.DocumentAttributeFilename(file_name=file_name)])
+
+def fake_history(count: int, newest: datetime | None = None, step: timedelta = timedelta(hours=1), size: int = 2048) -> list[FakeMessage]:
+    """`count` video messages, one per `step` going back from `newest`; message ids grow with the date."""
+    newest = newest or datetime(2024, 12, 31, 23, 0, tzinfo=timezone.utc)
+    return [FakeMessage(i, newest - step * (count - i), fake_document(1000 + i, size, f"clip_{i}.mp4")) for i in range(1, count + 1)]
+
+class FakeClient:
+    """Serves `messages` newest first in pages of `page_size`, and document bytes in the requested chunks.
+    Every history page and every file chunk request costs `latency` seconds; each iter_download stream is
+    limited to `stream_bps` bytes per second, as a single connection to a media DC is."""
+    def __init__(self, messages=(), latency: float = 0.0, stream_bps: float | None = None, page_size: int = 100) -> None:
+        self.messages = sorted(messages, key=lambda m: -m.id); self.latency = latency; self.stream_bps = stream_bps; self.page_size = page_size
+        self.fetched = 0; self.pages = 0; self.chunks = 0
+
+    async def get_entity(self, target): return types.PeerChannel(channel_id=int(str(target).lstrip('-')) if str(target).lstrip('-').isdigit() else 1)
+
+    def iter_messages(self, entity, min_id: int = 0, offset_date: datetime | None = None, filter=None, wait_time=None, **_):
+        """Like the server: starts below `offset_date` (when given) and stops at `min_id`."""
+        async def _pages():
+            pending = [m for m in self.messages if m.id > min_id and (offset_date is None or m.date < offset_date)]
+            for start in range(0, len(pending), self.page_size):
+                await asyncio.sleep(self.latency); self.pages += 1
+                for m in pending[start:start + self.page_size]:
+                    self.fetched += 1; yield m
+        return _pages()
+
+    def iter_download(self, document, offset: int = 0, limit: int | None = None, request_size: int = 512 * 1024, file_size: int | None = None, **_):
+        async def _chunks():
+            end = min(document.size, offset + limit * request_size) if limit else document.size
+            pos = offset
+            while pos < end:
+                n = min(request_size, end - pos)
+                await asyncio.sleep(self.latency + (n / self.stream_bps if self.stream_bps else 0)); self.chunks += 1
+                yield bytes(n); pos += n
+        return _chunks()
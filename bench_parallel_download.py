@@ -0,0 +1,44 @@
+"""Throughput of large-file downloads as one stream versus parallel byte ranges, against a fake file server.
+
+Each chunk request pays a round trip and each stream is capped at a per-connection rate, as against a
+media DC, so a single serial stream is latency- and connection-bound:
+
+    python bench_parallel_download.py --size-mb 32 --parts 1 4 8 --latency-ms 40 --stream-mbps 4
+"""
+from __future__ import annotations
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+
+from bench_fakes import FakeClient, fake_document
+from downloader_core import download_resumable, format_bytes
+
+async def measure(size: int, parts: int, latency: float, stream_bps: float, folder: str) -> float:
+    client = FakeClient(latency=latency, stream_bps=stream_bps)
+    path = os.path.join(folder, f"large_{parts}.mp4")
+    started = time.perf_counter()
+    await download_resumable(client, fake_document(1, size, "large.mp4"), path, size, parts=parts)
+    elapsed = time.perf_counter() - started
+    assert os.path.getsize(path) == size
+    os.remove(path)
+    return elapsed
+
+def main() -> None:
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--size-mb", type=int, default=32)
+    p.add_argument("--parts", type=int, nargs="+", default=[1, 2, 4, 8])
+    p.add_argument("--latency-ms", type=float, default=40.0, help="round trip per 512 KB chunk request")
+    p.add_argument("--stream-mbps", type=float, default=4.0, help="bandwidth of one connection, in MB/s")
+    args = p.parse_args()
+    size = args.size_mb * 1024 * 1024
+    print(f"{format_bytes(size)} file, {args.latency_ms:.0f} ms per request, {args.stream_mbps:g} MB/s per stream")
+    with tempfile.TemporaryDirectory() as folder:
+        baseline = None
+        for parts in args.parts:
+            elapsed = asyncio.run(measure(size, parts, args.latency_ms / 1000, args.stream_mbps * 1024 * 1024, folder))
+            baseline = baseline or elapsed
+            print(f"  parts={parts:<3} {elapsed:6.2f}s  {size / elapsed / 1024 / 1024:7.1f} MB/s  x{baseline / elapsed:.1f}")
+
+if __name__ == "__main__": main()
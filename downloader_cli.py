@@ -0,0 +1,163 @@
+"""Headless runner for the download engine; never imports PyQt.
+
+Reuses the API credentials in CONFIG_FILE and the session saved by the GUI login:
+
+    python -m downloader_cli --chat @somechannel --types photo,video --group chat_type
+    python -m downloader_cli --queue --watch 900      # job queue from the GUI, re-synced every 15 min
+    python -m downloader_cli --retry-failed           # only the downloads that failed before, no history scan
+    python -m downloader_cli --queue --dry-run        # how many files and bytes the job queue would download
+"""
+from __future__ import annotations
+import sys
+import asyncio
+import logging
+import argparse
+import signal
+
+from downloader_core import (
+    CONFIG_FILE, MEDIA_KINDS, ChatRecord, DownloadIndex, DownloadJob, RateControl, TargetRegistry, TransferStats, format_transfer, export_failures, import_failures,
+    summarize_manifest, format_manifest_summary, format_bytes, free_disk_space, read_config, read_session_string, date_filter_from_strings, job_from_spec
+)
+
+logger = logging.getLogger("downloader_cli")
+
+MEDIA_TYPES = tuple(key for key, _, _ in MEDIA_KINDS.values())
+GROUP_MODES = ('flat', 'chat', 'chat_type', 'chat_date')
+PROGRESS_LOG_INTERVAL = 10.0  # seconds between aggregate progress lines
+
+def build_parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(prog="python -m downloader_cli", description="Download Telegram media without the GUI.")
+    target = p.add_argument_group("target")
+    target.add_argument("--chat", action="append", default=[], help="@username, link or numeric ID; repeat for several chats")
+    target.add_argument("--queue", action="store_true", help="run the job queue saved by the GUI")
+    target.add_argument("--retry-failed", nargs="?", const="", metavar="FILE",
+                        help="retry only recorded failed downloads (of --chat, or of every chat); FILE adds the failures of an --export-failures file first")
+    target.add_argument("--export-failures", metavar="FILE", help="write the failed-download queue to FILE as JSON and exit")
+    p.add_argument("--path", help="download folder (default: the GUI's download_path)")
+    p.add_argument("--types", help=f"comma-separated media types: {','.join(MEDIA_TYPES)} (default: the GUI's checkboxes)")
+    p.add_argument("--from", dest="date_start", metavar="YYYY-MM-DD", help="oldest message date to include")
+    p.add_argument("--to", dest="date_end", metavar="YYYY-MM-DD", help="newest message date to include")
+    p.add_argument("--limit", type=int, help="stop after this many matching messages")
+    p.add_argument("--group", choices=GROUP_MODES, help="folder layout (default: the GUI's group_mode)")
+    p.add_argument("--name", metavar="TEMPLATE", help="file name template, e.g. '{msg_id}_{orig_name}' or '{date}_{id}' (default: the GUI's filename_template)")
+    p.add_argument("--concurrency", type=int, help="parallel downloads per chat")
+    p.add_argument("--parallel-chats", type=int, default=1, help="chats processed at once")
+    p.add_argument("--limit-rate", type=int, metavar="KBPS", help="overall download speed cap in KB/s, 0 for none (default: the GUI's bandwidth_limit_kbps)")
+    p.add_argument("--no-skip", action="store_true", help="download again even if the file already exists")
+    p.add_argument("--dry-run", action="store_true", help="only plan: report how many files and bytes would be downloaded, write nothing")
+    p.add_argument("--sync", action="store_true", help="only fetch messages newer than the last completed run")
+    p.add_argument("--no-dedup", action="store_true", help="download media again even if the same file was saved from another chat")
+    p.add_argument("--symlinks", action="store_true", help="symlink duplicates saved on another volume instead of copying them (default: the GUI's dedup_symlinks)")
+    p.add_argument("--hash", action="store_true", help="also link files with identical SHA-256 content (default: the GUI's dedup_hash)")
+    p.add_argument("--watch", type=int, metavar="SECONDS", help="keep running, re-syncing every SECONDS")
+    p.add_argument("--api-id", type=int, help="override the saved API ID")
+    p.add_argument("--api-hash", help="override the saved API hash")
+    p.add_argument("--config", default=CONFIG_FILE, help="config file to read (default: %(default)s)")
+    return p
+
+async def build_jobs(client, args, cfg: dict, sync_only: bool, index: DownloadIndex | None = None) -> list[DownloadJob]:
+    from telethon import utils
+    concurrency = args.concurrency or cfg.get("max_concurrent_downloads", 3)
+    kbps = cfg.get("bandwidth_limit_kbps", 0) if args.limit_rate is None else args.limit_rate
+    common = dict(concurrency=concurrency, rate=RateControl((kbps or 0) * 1024, max(1, args.parallel_chats) * concurrency),
+                  large_file_threshold_mb=cfg.get("large_file_threshold_mb", 100), large_file_parts=cfg.get("large_file_parts", 4),
+                  dedup=not args.no_dedup and cfg.get("dedup_enabled", True), hash_files=args.hash or cfg.get("dedup_hash", False),
+                  dedup_symlinks=args.symlinks or cfg.get("dedup_symlinks", False),
+                  targets=TargetRegistry(), dry_run=args.dry_run, log=logger.info, status=logger.debug,
+                  stats=TransferStats(lambda snap: logger.info(f"[PROGRESS] {format_transfer(snap)}"), PROGRESS_LOG_INTERVAL))
+    if args.retry_failed is not None:
+        chat_ids = [utils.get_peer_id(await client.get_entity(int(c) if c.lstrip('-').isdigit() else c)) for c in args.chat]
+        chat_ids = chat_ids or list(dict.fromkeys(row[0] for row in index.failures()))
+        # Failed files go back to their recorded paths, so folder layout and filters do not matter here
+        return [DownloadJob(chat_id, args.path or cfg.get("download_path"), dict.fromkeys(MEDIA_TYPES, True), True, chat_title=str(chat_id),
+                            retry_failed=True, **common) for chat_id in chat_ids]
+    if args.queue:
+        return [job_from_spec({**spec, "sync_only": spec.get("sync_only") or sync_only, "name_template": args.name or spec.get("name_template")}, **common)
+                for spec in cfg.get("job_queue") or []]
+    if args.types: wanted = {t.strip() for t in args.types.split(",") if t.strip()}
+    else: wanted = {t for t in MEDIA_TYPES if cfg.get(f"filter_{t}", False)}
+    filters = {t: t in wanted for t in MEDIA_TYPES}
+    jobs = []
+    for chat in args.chat:
+        target = int(chat) if chat.lstrip('-').isdigit() else chat
+        # Title as the GUI's chat picker shows it (with the member count), so chat-grouped folders match the ones it creates
+        title = ChatRecord.from_entity(await client.get_entity(target)).display_title or str(chat)
+        jobs.append(DownloadJob(target, args.path or cfg.get("download_path"), filters, not args.no_skip and cfg.get("skip_existing", True),
+                                date_filter_from_strings(args.date_start or "", args.date_end or ""), args.limit, args.group or cfg.get("group_mode", "flat"),
+                                title, sync_only=sync_only, name_template=args.name or cfg.get("filename_template"), **common))
+    return jobs
+
+async def run(args) -> int:
+    from telethon import TelegramClient
+    from telethon.sessions import StringSession
+    cfg = read_config(args.config)
+    try: api_id = args.api_id or int(cfg.get("api_id") or 0)
+    except ValueError: api_id = 0
+    api_hash = args.api_hash or cfg.get("api_hash", "")
+    session = read_session_string(api_id) if api_id else None
+    if not (api_id and api_hash and session):
+        logger.error("No saved login found. Log in once with the GUI (or pass --api-id/--api-hash for an existing session)."); return 2
+
+    client = TelegramClient(StringSession(session), api_id, api_hash); index = None
+    stop = asyncio.Event(); jobs: list[DownloadJob] = []
+    def _request_stop():
+        logger.info("Stop requested, finishing in-flight files..."); stop.set()
+        for job in jobs: job.stop()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try: loop.add_signal_handler(sig, _request_stop)
+        except (NotImplementedError, RuntimeError): pass  # Windows: Ctrl+C raises KeyboardInterrupt instead
+
+    try:
+        await client.connect()
+        if not await client.is_user_authorized(): logger.error("Saved session is not authorized; log in again with the GUI."); return 2
+        index = DownloadIndex(); failed = False
+        if args.retry_failed: logger.info(f"Imported {import_failures(index, args.retry_failed)} failed downloads from {args.retry_failed}.")
+        sem = asyncio.Semaphore(max(1, args.parallel_chats))
+        async def _one(job: DownloadJob) -> None:
+            nonlocal failed
+            async with sem:
+                if stop.is_set(): return
+                try:
+                    await job.run(client, index)
+                    failed = failed or bool(job.failed)
+                except Exception as e: logger.error(f"[{job.chat_title}] {e}"); failed = True
+        while True:
+            # Watch mode always syncs, so every cycle after the first only asks for new messages
+            jobs[:] = await build_jobs(client, args, cfg, sync_only=args.sync or bool(args.watch), index=index)
+            if not jobs and args.retry_failed is not None: logger.info("No failed downloads recorded."); return 0
+            if not jobs: logger.error("Nothing to do: pass --chat or --queue."); return 2
+            await asyncio.gather(*(_one(job) for job in jobs))
+            if args.dry_run:
+                total = summarize_manifest(i for job in jobs for i in job.manifest)
+                if len(jobs) > 1: logger.info(f"[PLAN] Total: {format_manifest_summary(total)}")
+                folder = args.path or cfg.get("download_path") or "."; free = free_disk_space(folder)
+                if free is not None:
+                    logger.info(f"[PLAN] Free space in {folder}: {format_bytes(free)}")
+                    if total['bytes'] > free: logger.warning(f"[PLAN] Not enough free space: {format_bytes(total['bytes'] - free)} more needed.")
+                break
+            if not args.watch or stop.is_set(): break
+            try: await asyncio.wait_for(stop.wait(), timeout=args.watch)
+            except asyncio.TimeoutError: pass
+            if stop.is_set(): break
+        return 1 if failed else 0
+    finally:
+        if index: index.close()
+        await client.disconnect()
+
+def main(argv: list[str] | None = None) -> int:
+    parser = build_parser(); args = parser.parse_args(argv)
+    if not (args.chat or args.queue or args.retry_failed is not None or args.export_failures):
+        parser.error("one of --chat, --queue, --retry-failed or --export-failures is required")
+    if args.types and (unknown := sorted({t.strip() for t in args.types.split(",") if t.strip()} - set(MEDIA_TYPES))):
+        parser.error(f"unknown media type(s) for --types: {', '.join(unknown)} (choose from {', '.join(MEDIA_TYPES)})")
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S', stream=sys.stdout)
+    if args.export_failures:
+        index = DownloadIndex()
+        try: logger.info(f"Exported {export_failures(index, args.export_failures)} failed downloads to {args.export_failures}.")
+        finally: index.close()
+        return 0
+    try: return asyncio.run(run(args))
+    except KeyboardInterrupt: return 130
+
+if __name__ == "__main__": sys.exit(main())
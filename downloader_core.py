@@ -0,0 +1,1260 @@
+"""Qt-free download engine shared by the GUI (app_pyqt6.py) and the headless CLI (downloader_cli.py)."""
+from __future__ import annotations
+import os
+import re
+import sys
+import json
+import time
+import asyncio
+import sqlite3
+import heapq
+import shutil
+import random
+import hashlib
+import functools
+import threading
+import mimetypes
+from datetime import datetime, timezone
+from typing import Dict, Any
+
+# --- Constants ---
+USER_DATA_DIR = os.path.join(
+    os.environ.get('LOCALAPPDATA') or os.environ.get('APPDATA') or os.path.expanduser('~'),
+    'TelegramMediaDownloader'
+)
+CONFIG_FILE = os.path.join(USER_DATA_DIR, "tg_downloader_config.json")
+DOWNLOAD_INDEX_FILE = os.path.join(USER_DATA_DIR, "download_index.sqlite3")
+DOWNLOAD_PATH_BASE = 'telegram_gui_downloads'
+DOWNLOAD_CHUNK_SIZE = 512 * 1024  # upload.getFile maximum; range offsets are aligned to it
+CHAT_CACHE_TTL = 6 * 3600  # seconds before a cached dialog list is refreshed in the background
+DIALOG_PAGE_SIZE = 100  # messages.getDialogs page size
+PROFILE_CACHE_DIR = os.path.join(USER_DATA_DIR, "profile_cache")
+PROFILE_CACHE_TTL = 24 * 3600  # seconds before a cached bio/member count is fetched again
+AVATAR_CACHE_MAX_BYTES = 50 * 1024 * 1024
+FLOOD_WAIT_RETRIES = 3  # times one file is retried after sitting out a FloodWaitError
+PLAN_AHEAD = 2000  # planned files buffered ahead of the transfers, so progress totals are known early
+HISTORY_PREFETCH = 500  # messages paged ahead of the scan (GetHistory returns at most 100 per request)
+DOWNLOAD_RETRIES = 4  # in-line retries of a transient download error, before the end-of-run pass
+RETRY_BACKOFF_BASE = 1.0; RETRY_BACKOFF_MAX = 60.0  # seconds
+
+# --- Config & session ---
+def read_config(path: str = CONFIG_FILE) -> Dict[str, Any]:
+    """Returns the saved GUI config as a plain dict ({} if missing or unreadable)."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f: return json.load(f)
+    except Exception: return {}
+
+def session_file_path(api_id: int) -> str:
+    return os.path.join(USER_DATA_DIR, f"tg_gui_session_{api_id}.session")
+
+def read_session_string(api_id: int) -> str | None:
+    """Returns the StringSession saved by the GUI login for `api_id`, or None."""
+    try:
+        with open(session_file_path(api_id), 'r', encoding='utf-8') as f: return f.read().strip() or None
+    except OSError: return None
+
+# --- Dialog list ---
+def chat_cache_path(api_id: int) -> str:
+    return os.path.join(USER_DATA_DIR, f"chat_cache_{api_id}.json")
+
+class ChatRecord:
+    """One dialog as the chat picker needs it. `kind` is 'user', 'bot', 'group' or 'channel'; `last_date` is
+    a UTC timestamp. Stored in the chat cache as a plain list in __slots__ order."""
+    __slots__ = ('id', 'kind', 'title', 'username', 'participants', 'last_date', 'unread', 'photo_id')
+    KINDS = ('user', 'bot', 'group', 'channel')
+
+    def __init__(self, id: int, kind: str, title: str, username: str | None = None, participants: int | None = None,
+                 last_date: float | None = None, unread: int = 0, photo_id: int | None = None) -> None:
+        """`photo_id` is 0 for a chat without a photo and None when unknown."""
+        self.id = id; self.kind = kind; self.title = title; self.username = username
+        self.participants = participants; self.last_date = last_date; self.unread = unread; self.photo_id = photo_id
+
+    @property
+    def is_user(self) -> bool: return self.kind in ('user', 'bot')
+
+    @property
+    def display_title(self) -> str:
+        """Title as the picker has always shown it: groups and channels carry their member count."""
+        return f"{self.title} ({self.participants})" if self.participants and not self.is_user else self.title
+
+    def to_list(self) -> list: return [getattr(self, k) for k in self.__slots__]
+
+    @classmethod
+    def from_list(cls, values: list) -> ChatRecord: return cls(*values)
+
+    @classmethod
+    def from_dialog(cls, d) -> ChatRecord:
+        ent = d.entity
+        if d.is_user: kind = 'bot' if getattr(ent, 'bot', False) else 'user'
+        else: kind = 'group' if d.is_group else 'channel'
+        return cls(d.id, kind, d.name or "", getattr(ent, 'username', None), None if d.is_user else getattr(ent, 'participants_count', None),
+                   d.date.timestamp() if d.date else None, d.unread_count or 0, entity_photo_id(ent))
+
+    @classmethod
+    def from_entity(cls, ent) -> ChatRecord:
+        """For a chat resolved without its dialog (the CLI): same kind and title, no date or unread count."""
+        from telethon import utils
+        from telethon.tl.types import User, Chat
+        if isinstance(ent, User): kind = 'bot' if ent.bot else 'user'
+        else: kind = 'group' if isinstance(ent, Chat) or getattr(ent, 'megagroup', False) else 'channel'
+        return cls(utils.get_peer_id(ent), kind, utils.get_display_name(ent), getattr(ent, 'username', None),
+                   None if kind in ('user', 'bot') else getattr(ent, 'participants_count', None), photo_id=entity_photo_id(ent))
+
+CHAT_CACHE_VERSION = 3
+
+def load_chat_cache(api_id: int) -> tuple[list | None, float]:
+    """Returns (ChatRecords, fetched_at) from the on-disk dialog cache, or (None, 0) if there is no usable one."""
+    try:
+        with open(chat_cache_path(api_id), 'r', encoding='utf-8') as f: data = json.load(f)
+        if data.get('version') != CHAT_CACHE_VERSION: return None, 0
+        return [ChatRecord.from_list(c) for c in data['chats']], float(data.get('fetched', 0))
+    except Exception: return None, 0
+
+def save_chat_cache(api_id: int, chats: list) -> None:
+    path = chat_cache_path(api_id); tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({'version': CHAT_CACHE_VERSION, 'fetched': time.time(), 'chats': [c.to_list() for c in chats]}, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+def remove_chat_cache(api_id: int) -> None:
+    try: os.remove(chat_cache_path(api_id))
+    except OSError: pass
+
+async def iter_dialog_pages(client, page_size: int = DIALOG_PAGE_SIZE):
+    """Yields the account's whole dialog list as pages of ChatRecords, as the server returns them."""
+    page = []
+    async for d in client.iter_dialogs(limit=None):
+        page.append(ChatRecord.from_dialog(d))
+        if len(page) >= page_size: yield page; page = []
+    if page: yield page
+
+# --- Profile & avatar cache ---
+def entity_photo_id(entity) -> int:
+    """The current profile photo's id (0 if the entity has none); comes with the entity, so costs no request."""
+    return getattr(getattr(entity, 'photo', None), 'photo_id', None) or 0
+
+class ProfileCache:
+    """Chat profiles and avatar files keyed by peer id. Avatar files are named after the photo id, so a
+    changed photo is a new file and an unchanged one is never downloaded twice; the least recently used
+    files are evicted once the folder passes `max_bytes`."""
+    def __init__(self, folder: str = PROFILE_CACHE_DIR, max_bytes: int = AVATAR_CACHE_MAX_BYTES, ttl: float = PROFILE_CACHE_TTL) -> None:
+        self.folder = folder; self.max_bytes = max_bytes; self.ttl = ttl
+        self.index_path = os.path.join(folder, 'index.json'); self._lock = threading.Lock()
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f: self._entries = json.load(f)
+        except Exception: self._entries = {}
+
+    def photo_file(self, peer_id: int, photo_id: int) -> str:
+        return os.path.join(self.folder, f"{peer_id}_{photo_id}.jpg")
+
+    def avatar_files(self) -> set[str]:
+        """Names of the avatar files on disk, from one listing of the folder (for checking many chats at once)."""
+        try: return {name for name in os.listdir(self.folder) if name.endswith('.jpg')}
+        except OSError: return set()
+
+    def avatar_path(self, peer_id: int, photo_id: int | None) -> str | None:
+        """Path of the cached avatar for this exact photo, or None if it is not on disk."""
+        if not photo_id: return None
+        path = self.photo_file(peer_id, photo_id)
+        return path if os.path.isfile(path) else None
+
+    def get(self, peer_id: int, photo_id: int | None = None) -> dict | None:
+        """The cached profile if it is younger than the TTL and, when `photo_id` is known, shows that photo."""
+        with self._lock:
+            entry = self._entries.get(str(peer_id))
+            if not entry or time.time() - entry['fetched'] > self.ttl: return None
+            if photo_id is not None and entry['photo_id'] != photo_id: return None
+            path = self.avatar_path(peer_id, entry['photo_id'])
+            if entry['photo_id'] and not path: return None
+            entry['used'] = time.time()
+            return {**entry['profile'], 'photo_path': path}
+
+    def put(self, peer_id: int, photo_id: int, profile: dict) -> None:
+        with self._lock:
+            profile = {k: v for k, v in profile.items() if k != 'photo_path'}
+            now = time.time()
+            self._entries[str(peer_id)] = {'photo_id': photo_id or 0, 'profile': profile, 'fetched': now, 'used': now}
+            self._evict(); self._save()
+
+    def _evict(self) -> None:
+        files = []
+        for name in os.listdir(self.folder) if os.path.isdir(self.folder) else []:
+            if not name.endswith('.jpg'): continue
+            peer, _, photo = name[:-4].partition('_'); entry = self._entries.get(peer)
+            # Superseded photos of a peer go first, then the least recently used
+            used = entry['used'] if entry and str(entry['photo_id']) == photo else 0
+            path = os.path.join(self.folder, name)
+            try: files.append((used, os.path.getsize(path), path))
+            except OSError: pass
+        total = sum(size for _, size, _ in files)
+        for used, size, path in sorted(files):
+            if total <= self.max_bytes and used: break
+            try: os.remove(path); total -= size
+            except OSError: pass
+
+    def _save(self) -> None:
+        os.makedirs(self.folder, exist_ok=True); tmp = self.index_path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f: json.dump(self._entries, f, ensure_ascii=False)
+        os.replace(tmp, self.index_path)
+
+_profile_cache: ProfileCache | None = None
+
+def profile_cache() -> ProfileCache:
+    global _profile_cache
+    if _profile_cache is None: _profile_cache = ProfileCache()
+    return _profile_cache
+
+async def cached_profile_photo(client, entity, peer_id: int) -> str | None:
+    """Path of the entity's current avatar, downloading it only if this photo id is not cached yet."""
+    photo_id = entity_photo_id(entity)
+    if not photo_id: return None
+    cache = profile_cache()
+    if path := cache.avatar_path(peer_id, photo_id): return path
+    os.makedirs(cache.folder, exist_ok=True)
+    return await client.download_profile_photo(entity, file=cache.photo_file(peer_id, photo_id))
+
+# --- Shared client service ---
+class ClientService:
+    """One long-lived Telegram client on its own event-loop thread. Callers hand it `async fn(client)`
+    callables instead of connecting (and handshaking) a fresh client for every action."""
+    def __init__(self, api_id: int, api_hash: str, session: str) -> None:
+        self.key = (api_id, api_hash, session)
+        self.loop = asyncio.new_event_loop(); self._client = None; self._connect_lock: asyncio.Lock | None = None
+        self._thread = threading.Thread(target=self._run_loop, name="telegram-client", daemon=True); self._thread.start()
+
+    def _run_loop(self) -> None:
+        asyncio.set_event_loop(self.loop); self.loop.run_forever()
+
+    async def _connected_client(self):
+        from telethon import TelegramClient
+        from telethon.sessions import StringSession
+        if self._connect_lock is None: self._connect_lock = asyncio.Lock()
+        async with self._connect_lock:
+            if self._client is None:
+                api_id, api_hash, session = self.key
+                self._client = TelegramClient(StringSession(session), api_id, api_hash)
+            if not self._client.is_connected(): await self._client.connect()
+        return self._client
+
+    def submit(self, fn):
+        """Schedules `fn(client)` on the service loop; returns a concurrent.futures.Future."""
+        async def _call(): return await fn(await self._connected_client())
+        return asyncio.run_coroutine_threadsafe(_call(), self.loop)
+
+    def call(self, fn, timeout: float | None = None):
+        """Runs `fn(client)` on the service loop and blocks the calling thread for its result."""
+        return self.submit(fn).result(timeout)
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Cancels everything still running on the loop, so threads blocked in `call` get CancelledError instead of
+        waiting forever, then disconnects and stops the loop thread."""
+        async def _shutdown():
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            for t in tasks: t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if self._client is not None: await self._client.disconnect()
+        try: asyncio.run_coroutine_threadsafe(_shutdown(), self.loop).result(timeout)
+        except Exception: pass
+        self.loop.call_soon_threadsafe(self.loop.stop); self._thread.join(timeout)
+
+_service: ClientService | None = None
+_service_lock = threading.Lock()
+
+def get_client_service(api_id: int, api_hash: str, session: str) -> ClientService:
+    """Returns the shared service for these credentials, replacing one that belongs to another login."""
+    global _service
+    with _service_lock:
+        if _service is not None and _service.key != (api_id, api_hash, session): _service.close(); _service = None
+        if _service is None: _service = ClientService(api_id, api_hash, session)
+        return _service
+
+def shutdown_client_service() -> None:
+    global _service
+    with _service_lock:
+        if _service is not None: _service.close(); _service = None
+
+# --- Helper: Sanitize Filename ---
+def sanitize_filename(name: str) -> str:
+    """Removes illegal characters from filenames for Windows/Linux."""
+    if not name: return "unnamed_file"
+    # Remove characters invalid on Windows
+    name = re.sub(r'[<>:"/\\|?*]', '_', name)
+    # Remove control characters
+    name = "".join(ch for ch in name if ord(ch) >= 32)
+    return name.strip() or "unnamed_file"
+
+# --- Helper: File naming ---
+NAME_TEMPLATES = ('{orig_name}', '{msg_id}_{orig_name}', '{date}_{id}')
+_fold_name = str.casefold if sys.platform in ('win32', 'darwin') else (lambda n: n)  # Case-insensitive filesystems
+
+def render_filename(template: str, msg, media, orig_name: str, chat_title: str = "") -> str:
+    """Fills a naming template. Fields: {orig_name} {stem} {ext} {msg_id} {id} (media id) {date} {time} {chat}.
+    The original extension is appended when the template leaves it out; a broken template falls back to the original name."""
+    stem, ext = os.path.splitext(orig_name); dt = msg.date
+    fields = dict(orig_name=orig_name, stem=stem, ext=ext, msg_id=msg.id, id=media.id, chat=chat_title,
+                  date=dt.strftime('%Y-%m-%d') if dt else 'unknown', time=dt.strftime('%H%M%S') if dt else '000000')
+    try: name = template.format(**fields)
+    except (KeyError, IndexError, ValueError, AttributeError): return orig_name
+    if ext and not name.lower().endswith(ext.lower()): name += ext
+    return sanitize_filename(name)
+
+def collision_candidates(path: str, msg_id: int):
+    """Deterministic alternatives for a taken `path`: `<stem>_<msg_id><ext>`, then `_<msg_id>_2`, `_3`, ...
+    A message always gets the same sequence, so a re-run finds its earlier copy instead of making a new name."""
+    base, ext = os.path.splitext(path)
+    yield f"{base}_{msg_id}{ext}"; n = 2
+    while True: yield f"{base}_{msg_id}_{n}{ext}"; n += 1
+
+# --- Helper: Resumable ranged download ---
+PART_SUFFIX = '.part'
+
+class PartJournal:
+    """Sidecar record of the chunks of a `.part` file that are already on disk."""
+    def __init__(self, path: str, size: int) -> None:
+        self.path = path; self.size = size; self.done: list[list[int]] = []
+
+    @classmethod
+    def load(cls, path: str, size: int) -> PartJournal:
+        journal = cls(path, size)
+        try:
+            with open(path, 'r', encoding='utf-8') as f: data = json.load(f)
+            if data.get('size') == size and data.get('chunk') == DOWNLOAD_CHUNK_SIZE:
+                journal.done = [[int(a), int(b)] for a, b in data.get('done', [])]
+        except Exception: pass
+        return journal
+
+    def add(self, start: int, end: int) -> None:
+        merged: list[list[int]] = []
+        for a, b in sorted(self.done + [[start, end]]):
+            if merged and a <= merged[-1][1]: merged[-1][1] = max(merged[-1][1], b)
+            else: merged.append([a, b])
+        self.done = merged
+
+    def missing(self, total_chunks: int) -> list[tuple[int, int]]:
+        gaps, pos = [], 0
+        for a, b in self.done:
+            if a > pos: gaps.append((pos, a))
+            pos = max(pos, b)
+        if pos < total_chunks: gaps.append((pos, total_chunks))
+        return gaps
+
+    def done_bytes(self) -> int:
+        return sum(min(b * DOWNLOAD_CHUNK_SIZE, self.size) - a * DOWNLOAD_CHUNK_SIZE for a, b in self.done)
+
+    def save(self) -> None:
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f: json.dump({'size': self.size, 'chunk': DOWNLOAD_CHUNK_SIZE, 'done': self.done}, f)
+        os.replace(tmp, self.path)
+
+    def remove(self) -> None:
+        try: os.remove(self.path)
+        except OSError: pass
+
+async def download_resumable(client, document, path: str, size: int, parts: int = 1, progress_callback=None, throttle=None) -> str:
+    """Downloads a document into `<path>.part`, pulling the chunks it is still missing as up to `parts`
+    concurrent byte ranges, then renames it to `path`. Completed chunks are journaled next to the part
+    file, so an interrupted download continues from where it stopped on the next run. `throttle` is an
+    optional coroutine function awaited with each chunk's size (see RateControl.throttle)."""
+    part_path = path + PART_SUFFIX
+    journal = PartJournal.load(part_path + '.json', size)
+    total_chunks = -(-size // DOWNLOAD_CHUNK_SIZE)
+    if not journal.done or not os.path.isfile(part_path) or os.path.getsize(part_path) != size:
+        journal.done = []
+        with open(part_path, 'wb') as f: f.truncate(size)
+
+    gaps = journal.missing(total_chunks)
+    per_span = max(1, -(-sum(b - a for a, b in gaps) // max(1, parts)))
+    spans = [(c, min(b, c + per_span)) for a, b in gaps for c in range(a, b, per_span)]
+    received = [journal.done_bytes()]
+    if progress_callback: progress_callback(received[0], size)
+
+    async def _pull(first_chunk: int, end_chunk: int) -> None:
+        offset = first_chunk * DOWNLOAD_CHUNK_SIZE; idx = first_chunk
+        with open(part_path, 'r+b') as f:
+            f.seek(offset)
+            async for data in client.iter_download(document, offset=offset, limit=end_chunk - first_chunk, request_size=DOWNLOAD_CHUNK_SIZE, chunk_size=DOWNLOAD_CHUNK_SIZE, file_size=size):
+                f.write(data); f.flush(); journal.add(idx, idx + 1); idx += 1; received[0] += len(data)
+                if idx % 8 == 0: journal.save()
+                if progress_callback: progress_callback(received[0], size)
+                if throttle: await throttle(len(data))
+
+    try: await asyncio.gather(*(_pull(a, b) for a, b in spans))
+    finally:
+        if os.path.isfile(part_path): journal.save()
+    os.replace(part_path, path); journal.remove()
+    return path
+
+# --- Download index ---
+class DownloadIndex:
+    """SQLite record of downloaded media per (chat, message, media), so skip checks are a keyed lookup
+    instead of filesystem probes."""
+    def __init__(self, path: str = DOWNLOAD_INDEX_FILE) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path); self._pending = 0
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS downloads (
+                chat_id INTEGER NOT NULL, msg_id INTEGER NOT NULL, media_id INTEGER NOT NULL, access_hash INTEGER,
+                path TEXT NOT NULL, size INTEGER, state TEXT NOT NULL, updated REAL,
+                PRIMARY KEY (chat_id, msg_id, media_id));
+            CREATE TABLE IF NOT EXISTS reconciled (
+                chat_id INTEGER NOT NULL, folder TEXT NOT NULL, scanned REAL,
+                PRIMARY KEY (chat_id, folder));
+            DROP TABLE IF EXISTS checkpoints;
+            CREATE TABLE IF NOT EXISTS sync_checkpoints (
+                chat_id INTEGER NOT NULL, scope TEXT NOT NULL, max_msg_id INTEGER NOT NULL, updated REAL,
+                PRIMARY KEY (chat_id, scope));
+            CREATE INDEX IF NOT EXISTS downloads_by_media ON downloads (media_id);
+            CREATE TABLE IF NOT EXISTS content_hashes (
+                sha256 TEXT PRIMARY KEY, path TEXT NOT NULL, size INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS failures (
+                chat_id INTEGER NOT NULL, msg_id INTEGER NOT NULL, media_id INTEGER NOT NULL, path TEXT,
+                error TEXT, attempts INTEGER NOT NULL DEFAULT 1, failed_at REAL,
+                PRIMARY KEY (chat_id, msg_id, media_id));
+        """)
+
+    def lookup(self, chat_id: int, msg_id: int, media_id: int) -> tuple | None:
+        """Returns (path, size, state) for a recorded media item, or None."""
+        return self.conn.execute("SELECT path, size, state FROM downloads WHERE chat_id=? AND msg_id=? AND media_id=?", (chat_id, msg_id, media_id)).fetchone()
+
+    def record(self, chat_id: int, msg_id: int, media_id: int, access_hash: int | None, path: str, size: int | None, state: str = 'done',
+               durable: bool = False) -> None:
+        """Rows are committed in batches of 100; `durable` commits at once. Files written to disk by this run are recorded
+        durably: once a folder is reconciled the index is trusted, so a finished file lost from it in a crash would be
+        taken for another chat's and saved again under a new name."""
+        # Updated in place: the row keeps its rowid, so find_media keeps preferring the first saved copy
+        self.conn.execute("INSERT INTO downloads VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT(chat_id, msg_id, media_id) DO UPDATE SET "
+                          "access_hash=excluded.access_hash, path=excluded.path, size=excluded.size, state=excluded.state, updated=excluded.updated",
+                          (chat_id, msg_id, media_id, access_hash, path, size, state, time.time()))
+        self._pending += 1
+        if durable or self._pending >= 100: self.commit()
+
+    def media_copies(self, media_id: int, exclude: str | None = None, message: tuple | None = None) -> list[str]:
+        """Recorded finished downloads of the same Telegram media (from any chat), first saved first; index only, no disk access.
+        Rows of `message`, a (chat_id, msg_id) pair, are left out: a message being downloaded again (skip off) must not
+        link to its own earlier copy, which may be the damaged file it is meant to replace."""
+        chat_id, msg_id = message or (None, None)
+        rows = self.conn.execute("SELECT path, chat_id, msg_id FROM downloads WHERE media_id=? AND state='done' ORDER BY rowid", (media_id,))
+        return [path for path, c, m in rows if path != exclude and (c, m) != (chat_id, msg_id)]
+
+    def find_media(self, media_id: int, size: int | None, exclude: str | None = None, message: tuple | None = None) -> str | None:
+        """The first of media_copies still on disk at `size`, for dedup links."""
+        for path in self.media_copies(media_id, exclude, message):
+            try:
+                if size is None or os.path.getsize(path) == size: return path
+            except OSError: pass
+        return None
+
+    def find_hash(self, sha256: str) -> tuple | None:
+        """Returns (path, size) of the first file saved with this content hash, or None."""
+        return self.conn.execute("SELECT path, size FROM content_hashes WHERE sha256=?", (sha256,)).fetchone()
+
+    def record_hash(self, sha256: str, path: str, size: int) -> None:
+        self.conn.execute("INSERT OR REPLACE INTO content_hashes VALUES (?, ?, ?)", (sha256, path, size)); self._pending += 1
+
+    def record_failure(self, chat_id: int, msg_id: int, media_id: int, path: str | None, error: str, attempts: int = 1) -> None:
+        """Adds a download that gave up to the failure queue; committed at once so it survives a crash."""
+        self.conn.execute("INSERT INTO failures VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT(chat_id, msg_id, media_id) DO UPDATE SET "
+                          "path=excluded.path, error=excluded.error, attempts=attempts+excluded.attempts, failed_at=excluded.failed_at",
+                          (chat_id, msg_id, media_id, path, error, attempts, time.time())); self.commit()
+
+    def clear_failure(self, chat_id: int, msg_id: int, media_id: int) -> None:
+        self.conn.execute("DELETE FROM failures WHERE chat_id=? AND msg_id=? AND media_id=?", (chat_id, msg_id, media_id)); self._pending += 1
+
+    def failures(self, chat_id: int | None = None) -> list[tuple]:
+        """(chat_id, msg_id, media_id, path, error, attempts, failed_at) rows, oldest failure first."""
+        if chat_id is None: return self.conn.execute("SELECT * FROM failures ORDER BY failed_at").fetchall()
+        return self.conn.execute("SELECT * FROM failures WHERE chat_id=? ORDER BY failed_at", (chat_id,)).fetchall()
+
+    def is_reconciled(self, chat_id: int, folder: str) -> bool:
+        return self.conn.execute("SELECT 1 FROM reconciled WHERE chat_id=? AND folder=?", (chat_id, folder)).fetchone() is not None
+
+    def mark_reconciled(self, chat_id: int, folder: str) -> None:
+        self.conn.execute("INSERT OR REPLACE INTO reconciled VALUES (?, ?, ?)", (chat_id, folder, time.time())); self.commit()
+
+    def get_checkpoint(self, chat_id: int, scope: str) -> int:
+        """Highest message id of the chat that a completed run with the same `scope` (see checkpoint_scope) has fully processed (0 if none)."""
+        row = self.conn.execute("SELECT max_msg_id FROM sync_checkpoints WHERE chat_id=? AND scope=?", (chat_id, scope)).fetchone()
+        return row[0] if row else 0
+
+    def set_checkpoint(self, chat_id: int, scope: str, msg_id: int) -> None:
+        self.conn.execute("INSERT INTO sync_checkpoints VALUES (?, ?, ?, ?) ON CONFLICT(chat_id, scope) DO UPDATE SET "
+                          "max_msg_id=MAX(max_msg_id, excluded.max_msg_id), updated=excluded.updated",
+                          (chat_id, scope, msg_id, time.time())); self.commit()
+
+    def commit(self) -> None: self.conn.commit(); self._pending = 0
+
+    def close(self) -> None:
+        try: self.commit()
+        finally: self.conn.close()
+
+# --- Helper: Dedup links ---
+FICLONE = 0x40049409  # Linux ioctl: share the source's extents (btrfs, XFS, ...)
+
+def link_file(src: str, dst: str, symlink: bool = False, copy: bool = True) -> str | None:
+    """Makes `dst` a copy of `src`, without copying data where possible: a reflink where the filesystem
+    supports it, else a hardlink. Neither works across volumes; there a symlink is made only when `symlink`
+    is set (it breaks once the other volume is unmounted), else the data is copied if `copy` is set, which
+    still saves the download. Returns the method used, or None if none worked."""
+    try:
+        import fcntl
+        with open(src, 'rb') as s, open(dst, 'wb') as d: fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        return 'reflink'
+    except (ImportError, OSError):
+        try: os.remove(dst)
+        except OSError: pass
+    try: os.link(src, dst); return 'hardlink'
+    except OSError: pass
+    if symlink:
+        try: os.symlink(os.path.abspath(src), dst); return 'symlink'
+        except OSError: pass
+    if copy:
+        try: shutil.copyfile(src, dst); return 'copy'
+        except OSError:
+            try: os.remove(dst)
+            except OSError: pass
+    return None
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while block := f.read(1024 * 1024): digest.update(block)
+    return digest.hexdigest()
+
+class DirCache:
+    """Per-run view of the target folders. Each folder is read with one os.scandir on first touch; after
+    that, existence, size and name-collision checks are dict lookups and folders already created are not
+    created again. Sizes are taken from the scandir entries only when asked for."""
+    def __init__(self) -> None:
+        self._dirs: Dict[str, dict] = {}  # folder -> {folded name: DirEntry, or size once resolved}
+        self._made: set = set()
+
+    def _listing(self, folder: str) -> dict:
+        entries = self._dirs.get(folder)
+        if entries is None:
+            entries = {}
+            try:
+                with os.scandir(folder) as it:
+                    for e in it: entries[_fold_name(e.name)] = e
+            except OSError: pass
+            self._dirs[folder] = entries
+        return entries
+
+    def lookup(self, path: str) -> tuple[bool, int | None]:
+        """(exists, size) for `path`; size is None for directories and unknown in-flight files."""
+        folder, name = os.path.split(path); entries = self._listing(folder); key = _fold_name(name)
+        if key not in entries: return False, None
+        value = entries[key]
+        if isinstance(value, os.DirEntry):
+            try: value = value.stat().st_size if value.is_file() else None
+            except OSError: value = None
+            entries[key] = value
+        return True, value
+
+    def add(self, path: str, size: int | None = None) -> None:
+        folder, name = os.path.split(path); self._listing(folder)[_fold_name(name)] = size
+
+    def makedirs(self, folder: str) -> None:
+        if folder in self._made: return
+        os.makedirs(folder, exist_ok=True); self._made.add(folder)
+
+    def scan_tree(self, folder: str, recursive: bool = True) -> int:
+        """Lists `folder` (and its subfolders) up front; returns the number of files found."""
+        files = 0; pending = [folder]
+        while pending:
+            for e in list(self._listing(pending.pop()).values()):
+                if not isinstance(e, os.DirEntry): continue
+                try:
+                    if e.is_dir(follow_symlinks=False):
+                        if recursive: pending.append(e.path)
+                    elif e.is_file(): files += 1
+                except OSError: pass
+        return files
+
+class TargetRegistry:
+    """The target folders' DirCache plus the paths claimed by queued or in-flight downloads (path -> expected
+    size). Jobs running at the same time must share one: otherwise two chats saving into the same folder both
+    see a name as free and overwrite each other's part and final files."""
+    def __init__(self) -> None:
+        self.dirs = DirCache(); self.claimed: Dict[str, int | None] = {}
+
+# --- Media classification ---
+# kind -> (filter checkbox key, chat_type folder, server-side search filters or None for "scan unfiltered")
+MEDIA_KINDS = {
+    'photo':    ('photo',      'Photos',       ('InputMessagesFilterPhotos',)),
+    'video':    ('video',      'Videos',       ('InputMessagesFilterVideo',)),
+    'round':    ('video_note', 'Round Videos', ('InputMessagesFilterRoundVideo',)),
+    'voice':    ('voice',      'Voice',        ('InputMessagesFilterVoice',)),
+    'audio':    ('audio',      'Audio',        ('InputMessagesFilterMusic',)),
+    'sticker':  ('sticker',    'Stickers',     None),
+    'gif':      ('gif',        'GIFs',         ('InputMessagesFilterGif',)),
+    'document': ('document',   'Documents',    None),
+}
+# Document rules in priority order, over (lower-case mime, {attribute class name: attribute}); the first match wins
+# and anything unmatched is a plain document. Attributes are looked up by name, so this runs without Telethon.
+DOCUMENT_RULES = (
+    ('sticker', lambda mime, attrs: 'DocumentAttributeSticker' in attrs or mime == 'application/x-tgsticker'),
+    ('round',   lambda mime, attrs: bool(getattr(attrs.get('DocumentAttributeVideo'), 'round_message', False))),
+    ('gif',     lambda mime, attrs: 'DocumentAttributeAnimated' in attrs or mime == 'image/gif'),
+    ('voice',   lambda mime, attrs: bool(getattr(attrs.get('DocumentAttributeAudio'), 'voice', False))),
+    ('video',   lambda mime, attrs: 'DocumentAttributeVideo' in attrs or mime.startswith('video/')),
+    ('audio',   lambda mime, attrs: 'DocumentAttributeAudio' in attrs or mime.startswith('audio/')),
+)
+
+def classify_media(msg) -> str | None:
+    """Returns the MEDIA_KINDS key for a message's media, or None if it has no photo or document."""
+    if getattr(msg, 'photo', None): return 'photo'
+    doc = getattr(msg, 'document', None)
+    if not doc: return None
+    mime = (getattr(doc, 'mime_type', '') or '').lower(); attrs = {type(a).__name__: a for a in getattr(doc, 'attributes', None) or []}
+    return next((kind for kind, rule in DOCUMENT_RULES if rule(mime, attrs)), 'document')
+
+def wanted_media(kind: str | None, filters: dict) -> bool:
+    return kind is not None and bool(filters.get(MEDIA_KINDS[kind][0]))
+
+def server_filters_for(filters: dict) -> list | None:
+    """Returns the message search filters for the checked media types, or None if the history must be scanned unfiltered."""
+    from telethon.tl import types
+    names: list[str] = []
+    for key, _, search in MEDIA_KINDS.values():
+        if not filters.get(key): continue
+        if search is None: return None
+        names.extend(n for n in search if n not in names)
+    return [getattr(types, n)() for n in names] or None
+
+def checkpoint_scope(filters: dict, base_folder: str) -> str:
+    """Sync checkpoint key for a chat: a run only covers the media types it asked for, saved under its folder,
+    so a Photos-only run must not let a later Video run skip the messages below its checkpoint."""
+    kinds = sorted(kind for kind in MEDIA_KINDS if wanted_media(kind, filters))
+    return f"{','.join(kinds)}|{os.path.normcase(os.path.abspath(base_folder))}"
+
+async def merge_message_streams(streams):
+    """Merges newest-first message iterators into a single newest-first stream, dropping duplicates."""
+    iters = [s.__aiter__() for s in streams]
+    heap = []
+    for i, msg in enumerate(await asyncio.gather(*(anext(it, None) for it in iters))):
+        if msg is not None: heapq.heappush(heap, (-msg.id, i, msg))
+    last_id = None
+    while heap:
+        _, i, msg = heapq.heappop(heap)
+        if msg.id != last_id: last_id = msg.id; yield msg
+        if (nxt := await anext(iters[i], None)) is not None: heapq.heappush(heap, (-nxt.id, i, nxt))
+
+class MessagePrefetcher:
+    """Runs a message iterator in its own task, `buffer` messages ahead of the consumer, so history pages are
+    requested while earlier messages are still being planned and downloaded. `waited` is the time the consumer
+    spent blocked on history, `fetch_time` the time spent inside the source iterator."""
+    def __init__(self, messages, buffer: int = HISTORY_PREFETCH) -> None:
+        self.messages = messages; self.waited = 0.0; self.fetch_time = 0.0
+        self._queue = asyncio.Queue(maxsize=max(1, buffer)); self._task = None
+
+    async def _produce(self) -> None:
+        try:
+            it = self.messages.__aiter__()
+            while True:
+                t = time.perf_counter(); msg = await anext(it, None); self.fetch_time += time.perf_counter() - t
+                if msg is None: break
+                await self._queue.put(msg)
+            await self._queue.put(None)
+        except Exception as e: await self._queue.put(e)
+
+    async def __aiter__(self):
+        self._task = asyncio.create_task(self._produce())
+        try:
+            while True:
+                t = time.perf_counter(); item = await self._queue.get(); self.waited += time.perf_counter() - t
+                if item is None: return
+                if isinstance(item, Exception): raise item
+                yield item
+        finally: self.close()
+
+    def close(self) -> None:
+        if self._task and not self._task.done(): self._task.cancel()
+
+# --- Transfer statistics ---
+def format_bytes(n: float) -> str:
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if abs(n) < 1024: return f"{n:.0f} {unit}" if unit == 'B' else f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} TB"
+
+class TransferStats:
+    """Aggregates per-chunk progress from every in-flight file and hands `on_update` a snapshot dict at
+    most once per `interval` seconds. The transfer rate is an exponential moving average over those ticks."""
+    def __init__(self, on_update=None, interval: float = 0.25, smoothing: float = 0.3) -> None:
+        self.on_update = on_update or (lambda snap: None); self.interval = interval; self.smoothing = smoothing
+        self.bytes_total = 0; self.bytes_done = 0; self.files_total = 0; self.files_done = 0; self.files_failed = 0
+        self.rate = 0.0; self.bytes_saved = 0; self._inflight = {}; self._moved = 0
+        self._last_emit = 0.0; self._last_moved = 0; self._last_tick = time.monotonic()
+
+    def file_queued(self, size: int | None) -> None:
+        self.files_total += 1; self.bytes_total += size or 0; self._maybe_emit()
+
+    def file_started(self, key, resumed: int | None = None) -> None:
+        """Pass resumed=None when the first progress report carries the bytes already on disk."""
+        self._inflight[key] = resumed
+        if resumed: self.bytes_done += resumed
+
+    def file_progress(self, key, done: int) -> None:
+        prev = self._inflight.get(key)
+        if prev is None: self.bytes_done += done  # Baseline of a resumed file: counts as done, not as throughput
+        else: delta = done - prev; self.bytes_done += delta; self._moved += delta
+        self._inflight[key] = done; self._maybe_emit()
+
+    def file_deduped(self, size: int) -> None:
+        """A file satisfied by linking an existing copy."""
+        self.bytes_saved += size; self._maybe_emit()
+
+    def file_dropped(self, expected: int | None) -> None:
+        """A queued file that was never started (e.g. the job was stopped)."""
+        self.files_total -= 1; self.bytes_total -= expected or 0
+
+    def file_retried(self, expected: int | None) -> None:
+        """A failed file queued again: no longer counted as failed."""
+        self.files_failed -= 1; self.bytes_total += expected or 0
+
+    def file_finished(self, key, ok: bool, size: int | None, expected: int | None = None) -> None:
+        """`size` is the final size on success; `expected` is what file_queued was told."""
+        got = self._inflight.pop(key, None) or 0
+        if ok:
+            # Photos are queued without a size: book their bytes now
+            self.bytes_total += (size or 0) - (expected or 0); self.bytes_done += (size or 0) - got; self.files_done += 1
+        else: self.bytes_total -= expected or 0; self.bytes_done -= got; self.files_failed += 1
+        self._maybe_emit()  # Throttled like chunk progress: a run of small photos finishes many files per interval
+
+    def snapshot(self) -> dict:
+        remaining = max(0, self.bytes_total - self.bytes_done)
+        return {
+            'bytes_done': self.bytes_done, 'bytes_total': self.bytes_total, 'rate': self.rate,
+            'eta': remaining / self.rate if self.rate > 0 and remaining else None,
+            'files_done': self.files_done, 'files_failed': self.files_failed, 'files_total': self.files_total,
+            'files_remaining': self.files_total - self.files_done - self.files_failed,
+            'percent': int(self.bytes_done * 100 / self.bytes_total) if self.bytes_total else 0,
+            'bytes_saved': self.bytes_saved,
+        }
+
+    def flush(self) -> None:
+        """Sends the current counts now; called once a job ends, so the last throttled updates are not lost."""
+        self._maybe_emit(force=True)
+
+    def _maybe_emit(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self._last_emit < self.interval: return
+        dt = now - self._last_tick
+        if dt > 0:
+            inst = (self._moved - self._last_moved) / dt
+            self.rate = inst if not self.rate else self.smoothing * inst + (1 - self.smoothing) * self.rate
+        self._last_tick = now; self._last_moved = self._moved; self._last_emit = now
+        self.on_update(self.snapshot())
+
+def format_transfer(snap: dict) -> str:
+    """One-line summary of a TransferStats snapshot, e.g. for the GUI progress label or CLI log."""
+    text = f"{format_bytes(snap['bytes_done'])} / {format_bytes(snap['bytes_total'])}  ·  {format_bytes(snap['rate'])}/s"
+    if snap['eta'] is not None:
+        m, s = divmod(int(snap['eta']), 60); h, m = divmod(m, 60)
+        text += f"  ·  ETA {h}:{m:02d}:{s:02d}" if h else f"  ·  ETA {m}:{s:02d}"
+    text += f"  ·  {snap['files_done']}/{snap['files_total']} files"
+    if snap['files_failed']: text += f" ({snap['files_failed']} failed)"
+    if snap.get('bytes_saved'): text += f"  ·  {format_bytes(snap['bytes_saved'])} deduplicated"
+    return text
+
+# --- Download plan ---
+_guess_extension = functools.lru_cache(maxsize=None)(mimetypes.guess_extension)
+
+def media_size(msg) -> int | None:
+    """Bytes a transfer of the message's media will move: the document size, or the largest photo size
+    (the one download_media picks). None when unknown."""
+    doc = getattr(msg, 'document', None)
+    if doc: return doc.size
+    best = 0
+    for ps in getattr(getattr(msg, 'photo', None), 'sizes', None) or []:
+        # PhotoSize has .size, PhotoSizeProgressive a list of .sizes, cached/stripped sizes inline .bytes
+        best = max(best, getattr(ps, 'size', 0) or max(getattr(ps, 'sizes', None) or [0]) or len(getattr(ps, 'bytes', b'') or b''))
+    return best or None
+
+def original_filename(msg) -> str:
+    """The document's own file name, else `file_<msg id>` with an extension guessed from the media type."""
+    doc = getattr(msg, 'document', None)
+    for a in getattr(doc, 'attributes', None) or []:
+        if type(a).__name__ == 'DocumentAttributeFilename' and a.file_name: return sanitize_filename(a.file_name)
+    if getattr(msg, 'photo', None): ext = ".jpg"
+    else: ext = (_guess_extension(getattr(doc, 'mime_type', '') or '') or "") if doc else ""
+    return sanitize_filename(f"file_{msg.id}{ext}")
+
+def target_folder(base_folder: str, group_mode: str, kind: str, msg) -> str:
+    """Folder a file goes to under the chat's base folder for the given grouping mode."""
+    if group_mode == 'chat_type': return os.path.join(base_folder, MEDIA_KINDS[kind][1])
+    if group_mode == 'chat_date': return os.path.join(base_folder, f"{msg.date.year}-{msg.date.month:02d}" if msg.date else "Unknown_Date")
+    return base_folder
+
+class PlanItem:
+    """One manifest entry: the message and media to fetch, the target path and the bytes it should move.
+    `action` is 'download', 'link' (same media recorded as saved at `src`; a download after all if no recorded
+    copy is still on disk when it runs), 'defer' (same media planned earlier
+    in this run; linked once that copy lands), 'present' (found on disk, not yet indexed) or 'skip' (indexed)."""
+    __slots__ = ('msg', 'media', 'kind', 'path', 'fname', 'size', 'action', 'src')
+
+    def __init__(self, msg, media, kind: str, path: str, fname: str, size: int | None, action: str = 'download', src: str | None = None) -> None:
+        self.msg = msg; self.media = media; self.kind = kind; self.path = path; self.fname = fname
+        self.size = size; self.action = action; self.src = src
+
+def summarize_manifest(items) -> dict:
+    """Totals of a dry-run manifest: {'files', 'bytes', 'by_kind': {kind: [files, bytes]}, 'present', 'linked', 'linked_bytes'}.
+    Only 'download' items count as files to transfer."""
+    out = {'files': 0, 'bytes': 0, 'by_kind': {}, 'present': 0, 'linked': 0, 'linked_bytes': 0}
+    for it in items:
+        if it.action == 'download':
+            out['files'] += 1; out['bytes'] += it.size or 0
+            k = out['by_kind'].setdefault(it.kind, [0, 0]); k[0] += 1; k[1] += it.size or 0
+        elif it.action in ('link', 'defer'): out['linked'] += 1; out['linked_bytes'] += it.size or 0
+        else: out['present'] += 1
+    return out
+
+def free_disk_space(path: str) -> int | None:
+    """Free bytes on the filesystem that `path` (or its nearest existing parent) lives on; None if unknown."""
+    path = os.path.abspath(path or '.')
+    while not os.path.exists(path) and os.path.dirname(path) != path: path = os.path.dirname(path)
+    try: return shutil.disk_usage(path).free
+    except OSError: return None
+
+def format_manifest_summary(summary: dict) -> str:
+    text = f"{summary['files']} files, {format_bytes(summary['bytes'])} to download"
+    if summary['by_kind']:
+        text += " (" + ", ".join(f"{MEDIA_KINDS[k][1]}: {n}, {format_bytes(b)}" for k, (n, b) in sorted(summary['by_kind'].items(), key=lambda kv: -kv[1][1])) + ")"
+    if summary['present']: text += f"; {summary['present']} already present"
+    if summary['linked']: text += f"; {summary['linked']} duplicates linked ({format_bytes(summary['linked_bytes'])})"
+    return text
+
+# --- Rate control ---
+class RateControl:
+    """Bandwidth cap and FloodWait back-off shared by every download on one client.
+
+    Bytes go through a token bucket: `throttle(n)` is awaited after each received chunk and sleeps off
+    whatever the chunk overdrew. `set_bandwidth` may be called from any thread while downloads run (0 means
+    unlimited). Downloads hold a slot while they run; a FloodWaitError pauses all of them for the advertised
+    time and halves the number of slots, and every `recover_after` clean downloads give one slot back."""
+    def __init__(self, bytes_per_sec: float = 0, max_concurrent: int = 1, recover_after: int = 10) -> None:
+        self.max_concurrent = max(1, int(max_concurrent or 1)); self.limit = self.max_concurrent; self.recover_after = recover_after
+        self.active = 0; self.paused_until = 0.0; self._streak = 0; self._cond = asyncio.Condition()
+        self.bytes_per_sec = 0.0; self._tokens = 0.0; self._stamp = time.monotonic(); self._generation = 0
+        self.set_bandwidth(bytes_per_sec)
+
+    def set_bandwidth(self, bytes_per_sec: float) -> None:
+        """Applies to the next chunk; sleepers from the old rate wake up early."""
+        self.bytes_per_sec = max(0.0, float(bytes_per_sec or 0)); self._tokens = 0.0; self._stamp = time.monotonic(); self._generation += 1
+
+    async def throttle(self, n: int) -> None:
+        await self._wait_pause()
+        rate = self.bytes_per_sec
+        if not rate or n <= 0: return
+        now = time.monotonic(); burst = max(rate, DOWNLOAD_CHUNK_SIZE)
+        self._tokens = min(burst, self._tokens + (now - self._stamp) * rate) - n; self._stamp = now
+        if self._tokens >= 0: return
+        generation = self._generation; until = now - self._tokens / rate
+        while generation == self._generation and (left := until - time.monotonic()) > 0:
+            await asyncio.sleep(min(left, 0.5))
+
+    async def acquire(self) -> None:
+        """Takes a download slot, then waits out any FloodWait pause."""
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.active < self.limit)
+            self.active += 1
+        await self._wait_pause()
+
+    async def release(self, ok: bool = True) -> None:
+        async with self._cond:
+            self.active -= 1
+            if ok and self.limit < self.max_concurrent:
+                self._streak += 1
+                if self._streak >= self.recover_after: self.limit += 1; self._streak = 0
+            self._cond.notify_all()
+
+    def flood_wait(self, seconds: int) -> int:
+        """Records a FloodWaitError; returns the reduced number of slots."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.limit = max(1, self.limit // 2); self._streak = 0
+        return self.limit
+
+    async def _wait_pause(self) -> None:
+        while (left := self.paused_until - time.monotonic()) > 0: await asyncio.sleep(left)
+
+# --- Retries & failure queue ---
+FAILURE_FIELDS = ('chat_id', 'msg_id', 'media_id', 'path', 'error', 'attempts', 'failed_at')
+
+def is_transient_error(e: BaseException) -> bool:
+    """Dropped connections, timeouts, Telegram 5xx and DC-migration (303) errors are worth retrying."""
+    if isinstance(e, (ConnectionError, asyncio.TimeoutError)): return True
+    code = getattr(e, 'code', None)
+    return isinstance(code, int) and (code >= 500 or code in (303, -503))
+
+def backoff_delay(attempt: int, base: float = RETRY_BACKOFF_BASE, cap: float = RETRY_BACKOFF_MAX) -> float:
+    """Exponential backoff with jitter: somewhere in the upper half of min(cap, base * 2**attempt)."""
+    ceiling = min(cap, base * 2 ** attempt)
+    return random.uniform(ceiling / 2, ceiling)
+
+async def fetch_messages_by_id(client, entity, ids: list) -> dict:
+    """{msg_id: message} for the ids that still exist, 100 per request. Fetched messages carry fresh file references."""
+    found = {}
+    for i in range(0, len(ids), 100):
+        for m in await client.get_messages(entity, ids=ids[i:i + 100]) or []:
+            if m is not None: found[m.id] = m
+    return found
+
+def export_failures(index: DownloadIndex, path: str, chat_id: int | None = None) -> int:
+    """Writes the failure queue as a JSON list for a later retry-only run (see import_failures); returns the count."""
+    rows = [dict(zip(FAILURE_FIELDS, row)) for row in index.failures(chat_id)]
+    with open(path, 'w', encoding='utf-8') as f: json.dump(rows, f, indent=2, ensure_ascii=False)
+    return len(rows)
+
+def import_failures(index: DownloadIndex, path: str) -> int:
+    """Adds the rows of an export_failures file that the index does not already queue; returns how many."""
+    with open(path, 'r', encoding='utf-8') as f: rows = json.load(f)
+    known = {row[:3] for row in index.failures()}
+    new = [r for r in rows if (r['chat_id'], r['msg_id'], r['media_id']) not in known]
+    for r in new: index.record_failure(r['chat_id'], r['msg_id'], r['media_id'], r.get('path'), r.get('error') or "", r.get('attempts') or 1)
+    return len(new)
+
+# --- Download engine ---
+class DownloadJob:
+    """Downloads the matching media of one chat over an already connected client, in stages: the history scan
+    classifies messages, a planner turns each into a PlanItem, and transfer workers execute the plan.
+    Progress is reported through plain callbacks and a TransferStats, and bandwidth/FloodWait handling goes
+    through a RateControl (a batch scheduler shares both between jobs), so the same job runs under a
+    single-chat worker, a batch scheduler or the CLI."""
+    def __init__(self, target, folder, filters, skip, date_filter=None, limit=None, group_mode='flat', chat_title=None, concurrency=1,
+                 large_file_threshold_mb=100, large_file_parts=4, sync_only=False, log=None, status=None, stats: TransferStats | None = None,
+                 dedup=True, hash_files=False, name_template=NAME_TEMPLATES[0], rate: RateControl | None = None, retry_failed=False, dry_run=False,
+                 targets: TargetRegistry | None = None, dedup_symlinks=False):
+        """With `retry_failed` the history scan is replaced by the chat's entries in the index's failure queue.
+        With `dry_run` the job only plans: `manifest` and `summary` say what a real run would do, and nothing is written.
+        Jobs that run concurrently (a batch) must be given one shared `targets` registry.
+        Dedup copies on another volume are copied rather than symlinked unless `dedup_symlinks` is set."""
+        self.target = target; self.folder = folder; self.filters = filters; self.skip = skip; self.date_filter = date_filter; self.limit = limit
+        self.group_mode = group_mode; self.chat_title = chat_title or str(target)
+        self.concurrency = max(1, int(concurrency or 1))
+        self.large_file_threshold = int(large_file_threshold_mb or 0) * 1024 * 1024 or float('inf'); self.large_file_parts = max(1, int(large_file_parts or 1))
+        self.sync_only = sync_only
+        self.log = log or (lambda m: None); self.status = status or (lambda s: None); self.stats = stats or TransferStats()
+        self.dedup = dedup; self.dedup_symlinks = dedup_symlinks; self.hash_files = hash_files; self.name_template = name_template or NAME_TEMPLATES[0]
+        self.rate = rate or RateControl(max_concurrent=self.concurrency); self.retry_failed = retry_failed; self.targets = targets
+        self.dry_run = dry_run; self.manifest: list[PlanItem] = []; self.summary = summarize_manifest([])
+        self.saved = 0; self.failed = 0; self.deduped = 0; self.dedup_bytes = 0
+        self._stop = False
+
+    def stop(self) -> None: self._stop = True
+
+    @property
+    def stopped(self) -> bool: return self._stop
+
+    async def _link_duplicate(self, src: str, path: str, fname: str, downloaded: bool = False) -> bool:
+        """Points `path` at the already saved `src` (see link_file); counts the bytes it saved. A file that was
+        `downloaded` anyway is only replaced by a link, never by a copy."""
+        method = await asyncio.to_thread(link_file, src, path, self.dedup_symlinks, not downloaded)
+        if not method: return False
+        for stale in (path + PART_SUFFIX, path + PART_SUFFIX + '.json'):
+            try: os.remove(stale)
+            except OSError: pass
+        size = os.path.getsize(path); self.deduped += 1; self.dedup_bytes += size; self.stats.file_deduped(size)
+        self.log(f"[DEDUP] {fname}: {'identical content, ' if downloaded else ''}{method} to {src}")
+        return True
+
+    async def run(self, client, index: DownloadIndex | None = None) -> bool:
+        """Runs the job to completion; returns False if it was stopped. Opens its own index unless one is shared."""
+        from telethon import utils
+        from telethon.errors import FloodWaitError, FileReferenceExpiredError
+        own_index = index is None
+        if own_index: index = DownloadIndex()
+        workers = []; prefetcher = None
+        try:
+            try: entity = await client.get_entity(int(self.target) if str(self.target).lstrip('-').isdigit() else self.target)
+            except Exception: entity = await client.get_entity(self.target)
+            processed = 0; full_scan = not self.date_filter
+            chat_id = utils.get_peer_id(entity)
+
+            # Planned downloads for the N transfer workers; the planner may run well ahead, so totals are known early
+            queue = asyncio.Queue(maxsize=PLAN_AHEAD)
+            # Target folders are listed once each; skip checks and name resolution then run in memory
+            targets = self.targets or TargetRegistry()
+            dirs = targets.dirs; claimed = targets.claimed  # path -> expected size of files queued or in flight, across the batch
+            inflight_media = set(); deferred = []  # repeats of media already queued wait for the first copy, then link to it
+            failed_items = []  # retried once more, with refetched messages, after everything else
+            counters = {'ok': 0, 'failed': 0}; timings = {'transfer': 0.0}
+
+            async def _fetch(msg, path, fname) -> int:
+                """Downloads one file inside a RateControl slot. A FloodWait pauses every download, an expired file
+                reference refetches the message, and transient errors back off; then the file is tried again."""
+                on_progress = lambda c, t, key=path: self.stats.file_progress(key, c)
+                flood_waits = retries = 0; refreshed = started = False
+                while True:
+                    await self.rate.acquire(); ok = False; delay = 0
+                    try:
+                        if getattr(msg, 'document', None) and msg.document.size:
+                            if not started:
+                                # Resumed only if download_resumable will keep the part file: full size, with finished chunks journaled
+                                exists, part_size = dirs.lookup(path + PART_SUFFIX)
+                                if exists and part_size == msg.document.size:
+                                    if resumed := PartJournal.load(path + PART_SUFFIX + '.json', part_size).done_bytes():
+                                        self.log(f"[RESUME] {fname}: {format_bytes(resumed)} of {format_bytes(part_size)} already downloaded")
+                                self.stats.file_started(path); started = True
+                            parts = self.large_file_parts if msg.document.size >= self.large_file_threshold else 1
+                            await download_resumable(client, msg.document, path, msg.document.size, parts, on_progress, self.rate.throttle)
+                            ok = True; return msg.document.size
+                        # Photos are small: fetch whole into a part file and rename once complete
+                        part_path = path + PART_SUFFIX; seen = [0]
+                        if os.path.isfile(part_path): os.remove(part_path)
+                        if not started: self.stats.file_started(path, 0); started = True
+                        async def on_photo_progress(c, t):
+                            on_progress(c, t); n = c - seen[0]; seen[0] = c
+                            await self.rate.throttle(n)
+                        saved = await client.download_media(msg, part_path, progress_callback=on_photo_progress)
+                        os.replace(saved, path)
+                        ok = True; return os.path.getsize(path)
+                    except FloodWaitError as e:
+                        flood_waits += 1
+                        if flood_waits > FLOOD_WAIT_RETRIES: raise
+                        slots = self.rate.flood_wait(e.seconds)
+                        self.log(f"[WAIT] {fname}: Telegram asked to wait {e.seconds}s; retrying with {slots} parallel download(s).")
+                        self.status(f"Rate limited, waiting {e.seconds}s...")
+                    except FileReferenceExpiredError:
+                        # File references expire after a while; the same message fetched again carries a fresh one
+                        if refreshed or not (fresh := (await fetch_messages_by_id(client, entity, [msg.id])).get(msg.id)) or not fresh.media: raise
+                        msg = fresh; refreshed = True; self.log(f"[RETRY] {fname}: file reference expired, refetched message #{msg.id}.")
+                    except Exception as e:
+                        retries += 1
+                        if retries > DOWNLOAD_RETRIES or not is_transient_error(e): raise
+                        delay = backoff_delay(retries); self.log(f"[RETRY] {fname}: {str(e) or type(e).__name__}; attempt {retries + 1} in {delay:.1f}s.")
+                    finally: await self.rate.release(ok)
+                    if delay: await asyncio.sleep(delay)
+
+            async def _consume():
+                while True:
+                    item = await queue.get()
+                    if item is None: queue.task_done(); return
+                    msg, path, fname, media, expected = item.msg, item.path, item.fname, item.media, item.size
+                    try:
+                        if self._stop: self.stats.file_dropped(expected); continue
+                        self.status(f"Downloading: {fname}")
+                        try:
+                            t = time.perf_counter()
+                            try: size = await _fetch(msg, path, fname)
+                            finally: timings['transfer'] += time.perf_counter() - t
+                            if self.hash_files:
+                                # Different media ids, same bytes (e.g. re-uploads): keep one copy on disk
+                                digest = await asyncio.to_thread(file_sha256, path); same = index.find_hash(digest)
+                                if same and same[0] != path and same[1] == size and os.path.isfile(same[0]):
+                                    # Set aside as the part file, which a successful link clears away
+                                    os.replace(path, path + PART_SUFFIX)
+                                    if not await self._link_duplicate(same[0], path, fname, downloaded=True): os.replace(path + PART_SUFFIX, path)
+                                else: index.record_hash(digest, path, size)
+                            index.record(chat_id, msg.id, media.id, getattr(media, 'access_hash', None), path, size, 'done', durable=True)
+                            index.clear_failure(chat_id, msg.id, media.id); dirs.add(path, size)
+                            self.stats.file_finished(path, True, size, expected)
+                            self.log(f"[OK] Saved: {os.path.basename(path)}"); counters['ok'] += 1
+                        except Exception as e:
+                            self.stats.file_finished(path, False, None, expected)
+                            error = str(e) or type(e).__name__; self.log(f"[ERROR] {fname}: {error}"); counters['failed'] += 1
+                            index.record_failure(chat_id, msg.id, media.id, path, error); failed_items.append(item)
+                    finally: claimed.pop(path, None); inflight_media.discard(media.id); queue.task_done()
+
+            if not self.dry_run: workers = [asyncio.create_task(_consume()) for _ in range(self.concurrency)]
+
+            # Base folder preparation
+            base_folder = self.folder
+            if self.group_mode in ['chat', 'chat_type', 'chat_date']:
+                base_folder = os.path.join(self.folder, sanitize_filename(self.chat_title))
+
+            # Ensure base folder exists if we are flat, or it will be created inside loop
+            if self.group_mode == 'flat' and not self.dry_run:
+                 dirs.makedirs(base_folder)
+
+            # Files saved before the index existed: list the whole tree up front instead of folder by folder
+            reconciled = index.is_reconciled(chat_id, base_folder)
+            reconciling = not self.retry_failed and not self.dry_run and not reconciled
+            if reconciling:
+                found = dirs.scan_tree(base_folder, recursive=self.group_mode in ('chat_type', 'chat_date'))
+                self.log(f"[INFO] Reconciling {found} existing files in {base_folder} with the download index.")
+
+            def _take(p):
+                """Marks `p` as used once it is claimed or linked."""
+                dirs.add(p, claimed.get(p))
+
+            def _existing(p):
+                """(exists, size) for a target path, counting queued/in-flight downloads as present."""
+                if p in claimed: return True, claimed[p]
+                return dirs.lookup(p)
+
+            def _earlier_copy(p, existing_size, doc_size) -> bool:
+                """Whether the file at `p` may be this message's download from an earlier run: same size (documents) or
+                same name (photos, only until the folder is reconciled; after that every photo of ours is in the index, so
+                an unindexed one of the same name belongs to another chat). Paths claimed in this run, by this or a
+                concurrent job, never are."""
+                if not self.skip or p in claimed: return False
+                return not reconciled if doc_size is None else existing_size == doc_size
+
+            def _plan(msg, kind) -> PlanItem:
+                """Decides the target path and action for one message from the index and the cached folder listings.
+                Writes nothing but the in-memory claims, so a dry run plans what a real run would do; the only disk access
+                is the one listing per target folder."""
+                media = msg.document or msg.photo; doc_size = msg.document.size if getattr(msg, 'document', None) else None
+                fname = render_filename(self.name_template, msg, media, original_filename(msg), self.chat_title)
+                final_folder = target_folder(base_folder, self.group_mode, kind, msg)
+                path = os.path.join(final_folder, fname)
+
+                def _item(action, p=None, src=None):
+                    p = p or path
+                    if action in ('download', 'defer', 'link'): claimed[p] = doc_size; _take(p)
+                    if action == 'download': inflight_media.add(media.id)
+                    return PlanItem(msg, media, kind, p, os.path.basename(p), media_size(msg), action, src)
+
+                # Indexed media in this folder: skip or resume without touching the filesystem
+                rec = index.lookup(chat_id, msg.id, media.id)
+                indexed = bool(rec) and (os.path.dirname(rec[0]) == final_folder or self.retry_failed) and rec[0] not in claimed
+                if indexed and rec[2] == 'done' and self.skip: return _item('skip', rec[0])
+                if indexed and rec[2] == 'partial': path = rec[0]
+                else:
+                    exists, existing_size = _existing(path)
+                    if exists and _earlier_copy(path, existing_size, doc_size): return _item('present')
+                    if exists:
+                        # Never overwrite: take this message's first free deterministic name, or find its copy from an earlier run
+                        for cand in collision_candidates(path, msg.id):
+                            exists, existing_size = _existing(cand)
+                            if not exists: path = cand; break
+                            if _earlier_copy(cand, existing_size, doc_size): return _item('present', cand)
+
+                # The same media already saved (another chat, a re-post): link it instead of downloading again.
+                # Whether that copy is still on disk is checked when the link is made, so planning reads only the index
+                if self.dedup:
+                    if copies := index.media_copies(media.id, exclude=path, message=(chat_id, msg.id)): return _item('link', src=copies[0])
+                    if media.id in inflight_media: return _item('defer')
+                return _item('download')
+
+            async def _execute(item: PlanItem) -> None:
+                nonlocal queue_wait
+                msg, media, path = item.msg, item.media, item.path; access_hash = getattr(media, 'access_hash', None)
+                if item.action == 'skip': self.log(f"[SKIP] {item.fname} already downloaded."); return
+                if item.action == 'present':
+                    self.log(f"[SKIP] {item.fname} exists."); index.record(chat_id, msg.id, media.id, access_hash, path, dirs.lookup(path)[1], 'done'); return
+                dirs.makedirs(os.path.dirname(path))
+                if item.action == 'defer': deferred.append(item); return
+                if item.action == 'link':
+                    claimed.pop(path, None)
+                    doc_size = msg.document.size if getattr(msg, 'document', None) else None
+                    if (src := index.find_media(media.id, doc_size, exclude=path, message=(chat_id, msg.id))) and await self._link_duplicate(src, path, item.fname):
+                        size = os.path.getsize(path); index.record(chat_id, msg.id, media.id, access_hash, path, size, 'done', durable=True); dirs.add(path, size); return
+                    # No recorded copy left at the right size, or it could not be linked: download it after all
+                    claimed[path] = doc_size; _take(path); inflight_media.add(media.id)
+                # Recorded before transfer so an interrupted download resumes into the same path
+                index.record(chat_id, msg.id, media.id, access_hash, path, getattr(media, 'size', None), 'partial')
+                self.stats.file_queued(item.size)
+                t = time.perf_counter(); await queue.put(item); queue_wait += time.perf_counter() - t
+
+            # Sync mode only asks the server for messages above the last completed run's high-water mark
+            scope = checkpoint_scope(self.filters, base_folder); checkpoint = index.get_checkpoint(chat_id, scope); highest_seen = 0; fetched = 0
+            if self.sync_only and checkpoint and not self.retry_failed: self.log(f"[INFO] Sync mode: fetching messages newer than #{checkpoint}.")
+            # With a date window the server seeks straight to its end; the start boundary below stops the scan
+            offset_date = self.date_filter[1] if self.date_filter else None
+            # wait_time=0: no pause between history pages (Telethon otherwise sleeps 1s per page on unbounded scans)
+            history_kwargs = dict(min_id=checkpoint if self.sync_only else 0, offset_date=offset_date, wait_time=0)
+            if self.retry_failed:
+                # Retry-only run: fetch the queued failures by id instead of scanning the history
+                full_scan = False; pending = []
+                for _, msg_id, media_id, *_ in index.failures(chat_id):
+                    rec = index.lookup(chat_id, msg_id, media_id)
+                    if rec and rec[2] == 'done' and os.path.isfile(rec[0]): index.clear_failure(chat_id, msg_id, media_id)
+                    else: pending.append(msg_id)
+                found = await fetch_messages_by_id(client, entity, pending)
+                for _, msg_id, media_id, *_ in index.failures(chat_id):
+                    if msg_id not in found: index.clear_failure(chat_id, msg_id, media_id); self.log(f"[SKIP] Message #{msg_id} no longer exists.")
+                self.log(f"[INFO] Retrying {len(found)} failed downloads; history scan skipped.")
+                messages = _listed(sorted(found.values(), key=lambda m: -m.id))
+            # Let the server drop non-matching messages when every checked type has a search filter
+            elif search_filters := server_filters_for(self.filters):
+                self.log(f"[INFO] Server-side filters: {', '.join(type(f).__name__.replace('InputMessagesFilter', '') for f in search_filters)}")
+                if len(search_filters) == 1: messages = client.iter_messages(entity, filter=search_filters[0], **history_kwargs)
+                else: messages = merge_message_streams([client.iter_messages(entity, filter=f, **history_kwargs) for f in search_filters])
+            else: messages = client.iter_messages(entity, **history_kwargs)
+            # Pages history ahead while the loop below plans and queues downloads; timings are logged at the end
+            messages = prefetcher = MessagePrefetcher(messages); queue_wait = 0.0; started_at = time.perf_counter()
+            async for msg in messages:
+                if self._stop: break
+                highest_seen = max(highest_seen, msg.id); fetched += 1
+                if self.limit and processed >= self.limit: self.log(f"[INFO] Reached limit of {self.limit} messages."); full_scan = False; break
+                if self.date_filter:
+                    start_dt, end_dt = self.date_filter
+                    if msg.date:
+                        m_dt = msg.date.astimezone(timezone.utc)
+                        if m_dt > end_dt: continue 
+                        if m_dt < start_dt: self.log("[INFO] Reached start date boundary."); break
+                if not msg.media: continue
+
+                # Determine type for matching and grouping
+                kind = classify_media(msg)
+                if not wanted_media(kind, self.filters): continue
+                processed += 1
+                item = _plan(msg, kind)
+                if self.dry_run: self.manifest.append(item); continue
+                await _execute(item)
+
+            # Repeats seen while their first copy was in flight: link once it has landed, download if it failed
+            if deferred:
+                await queue.join()
+                for item in deferred:
+                    msg, path, fname, media = item.msg, item.path, item.fname, item.media
+                    claimed.pop(path, None)
+                    if self._stop: break
+                    if (src := index.find_media(media.id, getattr(media, 'size', None) if getattr(msg, 'document', None) else None, exclude=path, message=(chat_id, msg.id))) and await self._link_duplicate(src, path, fname):
+                        index.record(chat_id, msg.id, media.id, getattr(media, 'access_hash', None), path, os.path.getsize(path), 'done', durable=True); continue
+                    index.record(chat_id, msg.id, media.id, getattr(media, 'access_hash', None), path, getattr(media, 'size', None), 'partial')
+                    claimed[path] = msg.document.size if getattr(msg, 'document', None) else None; inflight_media.add(media.id)
+                    self.stats.file_queued(item.size); await queue.put(item)
+
+            # Files that failed every in-line retry get one more pass, with freshly fetched messages
+            if not self._stop and not self.dry_run:
+                await queue.join()
+                if failed_items and not self._stop:
+                    retry = failed_items[:]; failed_items.clear()
+                    self.log(f"[RETRY] Retrying {len(retry)} failed files.")
+                    found = await fetch_messages_by_id(client, entity, [it.msg.id for it in retry])
+                    for item in retry:
+                        item.msg = found.get(item.msg.id) or item.msg
+                        claimed[item.path] = item.msg.document.size if getattr(item.msg, 'document', None) else None; inflight_media.add(item.media.id); _take(item.path)
+                        counters['failed'] -= 1; self.stats.file_retried(item.size)
+                        await queue.put(item)
+
+            # Drain the queue, then release the consumers
+            for _ in workers: await queue.put(None)
+            await asyncio.gather(*workers)
+            self.saved, self.failed = counters['ok'], counters['failed']
+            if self.failed: self.log(f"[INFO] {self.failed} files failed; they stay queued for a retry-only run.")
+            self.log(f"[INFO] Scanned {fetched} messages, {processed} matched.")
+            if self.dry_run:
+                self.summary = summarize_manifest(self.manifest)
+                self.log(f"[PLAN] {format_manifest_summary(self.summary)}")
+                return not self._stop
+            self.log(f"[INFO] Timing: {time.perf_counter() - started_at:.1f}s total; scan waited {prefetcher.waited:.1f}s on history "
+                     f"({prefetcher.fetch_time:.1f}s fetching) and {queue_wait:.1f}s on busy downloads; transfers took {timings['transfer']:.1f}s summed over files.")
+            if self.deduped: self.log(f"[INFO] Deduplicated {self.deduped} files, saving {format_bytes(self.dedup_bytes)}.")
+            if reconciling and full_scan and not self._stop: index.mark_reconciled(chat_id, base_folder)
+            # Only a run that saw every message above the checkpoint, with nothing failed, may advance it
+            if full_scan and not self._stop and not counters['failed'] and highest_seen: index.set_checkpoint(chat_id, scope, highest_seen)
+
+            return not self._stop
+        finally:
+            for w in workers: w.cancel()
+            self.stats.flush()
+            if prefetcher: prefetcher.close()
+            if own_index: index.close()
+
+async def _listed(items):
+    for item in items: yield item
+
+def date_filter_from_strings(start: str, end: str) -> tuple | None:
+    """Turns a 'yyyy-MM-dd' pair into the inclusive UTC window DownloadJob expects (None if either is empty)."""
+    if not start or not end: return None
+    d_start = datetime.strptime(start, "%Y-%m-%d").date(); d_end = datetime.strptime(end, "%Y-%m-%d").date()
+    return (datetime.combine(d_start, datetime.min.time()).replace(tzinfo=timezone.utc), datetime.combine(d_end, datetime.max.time()).replace(tzinfo=timezone.utc))
+
+def job_from_spec(spec: dict, **kwargs) -> DownloadJob:
+    """Builds a DownloadJob from a persisted job-queue entry."""
+    return DownloadJob(spec['chat_id'], spec['folder'], spec['filters'], spec.get('skip', True), date_filter_from_strings(spec.get('date_start', ''), spec.get('date_end', '')),
+                       spec.get('limit') or None, spec.get('group_mode', 'flat'), spec.get('title'), sync_only=spec.get('sync_only', False),
+                       name_template=spec.get('name_template') or NAME_TEMPLATES[0], retry_failed=spec.get('retry_failed', False), **kwargs)